@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, insert, literal, or_, select
+
+import detailcache
+from database import ArchivedPermitApplication, PermitApplication, engine_sync
+from review import CLOSED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Moves old and closed applications out of permit_applications into
+# permit_applications_archive, keeping the hot table (and its indexes)
+# small for the admin list. Archived rows stay viewable and searchable.
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_CLOSED_AFTER_DAYS = int(os.getenv("ARCHIVE_CLOSED_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "86400"))
+ARCHIVE_BATCH = 1000
+
+COLUMNS = [column.name for column in PermitApplication.__table__.columns]
+
+_task = None
+
+def archivable(now=None):
+    # submitted_at is stored in UTC by SQLite's CURRENT_TIMESTAMP
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    return or_(
+        PermitApplication.submitted_at < now - timedelta(days=ARCHIVE_AFTER_DAYS),
+        and_(
+            PermitApplication.status.in_(CLOSED_STATUSES),
+            PermitApplication.decided_at < now - timedelta(days=ARCHIVE_CLOSED_AFTER_DAYS)
+        )
+    )
+
+def archive_where(condition, engine=engine_sync, batch_size=ARCHIVE_BATCH):
+    # Each batch is copied and deleted in its own short transaction so
+    # writers are only blocked briefly.
+    moved = 0
+    archived_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(PermitApplication.id).where(condition).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                return moved
+            source = select(
+                *[PermitApplication.__table__.c[name] for name in COLUMNS],
+                literal(archived_at)
+            ).where(PermitApplication.id.in_(ids))
+            conn.execute(insert(ArchivedPermitApplication).from_select(COLUMNS + ["archived_at"], source))
+            conn.execute(delete(PermitApplication).where(PermitApplication.id.in_(ids)))
+        # After the commit: cached pages still show these as live
+        detailcache.invalidate(ids)
+        moved += len(ids)
+
+def run_archive(engine=engine_sync):
+    return archive_where(archivable(), engine)
+
+async def _archiver():
+    while True:
+        try:
+            moved = await asyncio.to_thread(run_archive)
+            if moved:
+                logger.info("Archived %s permit applications", moved)
+        except Exception:
+            logger.exception("Archival run failed")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+async def start():
+    global _task
+    _task = asyncio.create_task(_archiver())
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+    _task = None
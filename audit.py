@@ -0,0 +1,99 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import sqlite
+
+from database import database, AuditEvent
+
+logger = logging.getLogger(__name__)
+
+# Records which admin viewed, listed or exported applicant data. record()
+# only appends to an in-memory buffer so admin pages do not wait on a
+# write; a background task inserts the buffer in one transaction (one
+# fsync) every AUDIT_FLUSH_INTERVAL seconds, or sooner once AUDIT_BATCH
+# events are waiting. Nothing is dropped: events left at shutdown are
+# flushed by stop().
+
+FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "2"))
+BATCH_SIZE = int(os.getenv("AUDIT_BATCH", "500"))
+
+INSERT_SQL = str(insert(AuditEvent).compile(
+    dialect=sqlite.dialect(paramstyle="named"),
+    column_keys=["at", "actor_id", "actor_name", "action", "application_id", "detail", "ip"]
+))
+
+_buffer = deque()
+_pending = None
+_task = None
+
+audit_stats = {
+    "written": 0,
+    "last_flush_at": None,
+    "last_flush_ms": None,
+}
+
+def record(user, action, request=None, application_id=None, detail=None):
+    _buffer.append({
+        "at": time.time(),
+        "actor_id": str(user.get("id")),
+        "actor_name": user.get("username"),
+        "action": action,
+        "application_id": application_id,
+        "detail": json.dumps(detail) if detail else None,
+        "ip": request.client.host if request is not None and request.client else None,
+    })
+    if len(_buffer) >= BATCH_SIZE and _pending is not None:
+        _pending.set()
+
+async def flush():
+    if not _buffer:
+        return 0
+    batch = list(_buffer)
+    started = time.perf_counter()
+    async with database.connection() as connection:
+        async with connection.transaction():
+            await connection.raw_connection.executemany(INSERT_SQL, batch)
+    # Only drop what was written; record() may have appended meanwhile
+    for _ in batch:
+        _buffer.popleft()
+    audit_stats["written"] += len(batch)
+    audit_stats["last_flush_at"] = time.time()
+    audit_stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return len(batch)
+
+async def _flusher():
+    while True:
+        try:
+            await asyncio.wait_for(_pending.wait(), FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _pending.clear()
+        try:
+            await flush()
+        except Exception:
+            # Keep the events and try again on the next round
+            logger.exception("Audit log flush failed")
+
+def metrics():
+    return {"buffered": len(_buffer), **audit_stats}
+
+async def start():
+    global _pending, _task
+    _pending = asyncio.Event()
+    _task = asyncio.create_task(_flusher())
+
+async def stop():
+    global _pending, _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+    try:
+        await flush()
+    except Exception:
+        logger.exception("Final audit log flush failed; %s events lost", len(_buffer))
+    _pending, _task = None, None
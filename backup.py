@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from database import engine_sync
+
+logger = logging.getLogger(__name__)
+
+# Online snapshots of the application database using SQLite's backup API.
+# The copy is made a few hundred pages at a time with a short sleep between
+# steps, inside one read transaction: under WAL that transaction does not
+# block writers, and it pins a consistent snapshot so concurrent commits do
+# not make the backup restart from page one. Snapshots are rotated and
+# carry a sha256 sidecar that restore() verifies.
+
+DATABASE_PATH = engine_sync.url.database
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL", str(6 * 3600)))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "8"))
+BACKUP_PAGES = int(os.getenv("BACKUP_PAGES", "256"))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.005"))
+# Workers share BACKUP_DIR; a lock older than this is left over from a crash
+LOCK_STALE_AFTER = 6 * 3600
+
+PREFIX = "permit_applications-"
+SUFFIX = ".db"
+
+backup_stats = {
+    "last_backup_at": None,
+    "last_backup_seconds": None,
+    "last_backup_bytes": None,
+    "last_error": None,
+}
+
+_task = None
+
+# ----- Snapshots -----
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def snapshots(backup_dir=BACKUP_DIR):
+    # Newest first; only snapshots whose checksum was written count
+    if not os.path.isdir(backup_dir):
+        return []
+    names = [
+        name for name in os.listdir(backup_dir)
+        if name.startswith(PREFIX) and name.endswith(SUFFIX)
+        and os.path.exists(os.path.join(backup_dir, name + ".sha256"))
+    ]
+    return [os.path.join(backup_dir, name) for name in sorted(names, reverse=True)]
+
+def rotate(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    for path in snapshots(backup_dir)[keep:]:
+        for stale in (path, path + ".sha256"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+def acquire_lock(backup_dir):
+    lock_path = os.path.join(backup_dir, ".backup.lock")
+    for _ in range(2):
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock_path
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) < LOCK_STALE_AFTER:
+                    return None
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+    return None
+
+def create_backup(database_path=DATABASE_PATH, backup_dir=BACKUP_DIR, pages=BACKUP_PAGES,
+                  step_sleep=BACKUP_STEP_SLEEP, keep=BACKUP_KEEP):
+    # Blocking; run it in a thread. Returns the snapshot path, or None if
+    # another process is already taking one.
+    os.makedirs(backup_dir, exist_ok=True)
+    lock_path = acquire_lock(backup_dir)
+    if lock_path is None:
+        return None
+    # Holding the lock, any partial file is left over from a crashed run
+    for name in os.listdir(backup_dir):
+        if name.endswith(".partial"):
+            os.remove(os.path.join(backup_dir, name))
+
+    started = time.monotonic()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    path = os.path.join(backup_dir, f"{PREFIX}{stamp}{SUFFIX}")
+    partial_path = path + ".partial"
+    try:
+        source = sqlite3.connect(database_path, isolation_level=None)
+        target = sqlite3.connect(partial_path)
+        try:
+            source.execute("BEGIN")
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            source.backup(target, pages=pages, progress=lambda *_: time.sleep(step_sleep))
+            source.execute("COMMIT")
+            # Self-contained file that opens without a -wal next to it
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+
+        checksum = sha256_file(partial_path)
+        os.replace(partial_path, path)
+        with open(path + ".sha256", "w") as f:
+            f.write(f"{checksum}  {os.path.basename(path)}\n")
+        rotate(backup_dir, keep)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except FileNotFoundError:
+            pass
+        raise
+    finally:
+        os.remove(lock_path)
+
+    backup_stats["last_backup_at"] = time.time()
+    backup_stats["last_backup_seconds"] = round(time.monotonic() - started, 3)
+    backup_stats["last_backup_bytes"] = os.path.getsize(path)
+    backup_stats["last_error"] = None
+    return path
+
+# ----- Restore -----
+
+def verify(path):
+    with open(path + ".sha256") as f:
+        expected = f.read().split()[0]
+    if sha256_file(path) != expected:
+        raise ValueError(f"Checksum mismatch for {path}")
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise ValueError(f"Integrity check failed for {path}: {result}")
+
+def restore(path, database_path=DATABASE_PATH):
+    # Only while the site is stopped: open connections would keep using
+    # the replaced file.
+    verify(path)
+    tmp_path = database_path + ".restore"
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    for suffix in ("-wal", "-shm"):
+        try:
+            os.remove(database_path + suffix)
+        except FileNotFoundError:
+            pass
+    os.replace(tmp_path, database_path)
+
+# ----- Scheduler -----
+
+async def _scheduler():
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL)
+        try:
+            path = await asyncio.to_thread(create_backup)
+            if path:
+                logger.info("Database backed up to %s in %ss", path, backup_stats["last_backup_seconds"])
+        except Exception as exc:
+            backup_stats["last_error"] = repr(exc)
+            logger.exception("Database backup failed")
+
+async def start():
+    global _task
+    if BACKUP_INTERVAL > 0:
+        _task = asyncio.create_task(_scheduler())
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        # A snapshot in progress finishes in its thread; cancelling only
+        # stops the schedule
+        await asyncio.gather(_task, return_exceptions=True)
+    _task = None
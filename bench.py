@@ -0,0 +1,1332 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# End-to-end benchmarks. Every route is driven in-process through httpx's
+# ASGI transport against a throwaway database seeded with synthetic data,
+# and Discord is replaced by mock_discord. Results are compared with the
+# stored baseline and the run fails on regressions beyond --threshold, or
+# when there is no baseline to compare with. Timings depend on the machine,
+# so record the baseline where the comparison will run. The defaults seed
+# small tables; the 1M-row checks are opt-in.
+#
+#   python bench.py --update-baseline     # record a new baseline
+#   python bench.py                       # compare against it
+#   python bench.py --rows 1000000 --portal-rows 1000000 \
+#       --only dashboard_stats export_memory my_applications
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(REPO_DIR, "bench_baseline.json")
+
+# Throughput and success metrics; everything else is a time or a size
+HIGHER_IS_BETTER = ("rps", "_per_s", "_mb_s", "hit_rate", "_ok")
+# Describe the workload rather than how well it ran
+NOT_COMPARED = {"pages", "files_compressed", "db_mb", "csv_mb", "ndjson_mb"}
+
+SCENARIOS = {}
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+class BenchContext:
+    def __init__(self, args, main, client, admin_client):
+        self.args = args
+        self.main = main
+        self.client = client
+        self.admin_client = admin_client
+
+# ----- Helpers -----
+
+def prepare_workdir():
+    # Run against a scratch copy of the working directory so the real
+    # database and uploads are never touched.
+    workdir = tempfile.mkdtemp(prefix="driftsite-bench-")
+    for name in ("templates", "static"):
+        os.symlink(os.path.join(REPO_DIR, name), os.path.join(workdir, name))
+    os.chdir(workdir)
+    return workdir
+
+def summarize(latencies, elapsed, sizes):
+    latencies = sorted(latencies)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "bytes": max(sizes),
+    }
+
+async def measure(make_request, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+            return len(response.content)
+
+    start = time.perf_counter()
+    sizes = await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, time.perf_counter() - start, sizes)
+
+def permit_form(i):
+    return {
+        "full_name": f"Bench Pirate {i}",
+        "crew": "The Benchmark",
+        "preferred_contact": "Discord",
+        "permit_type": "Trade Permit",
+        "permit_details": "Benchmark submission",
+        "applicant_signature": f"Bench Pirate {i}",
+        "application_date": "2025-01-01",
+    }
+
+# ----- Route Scenarios -----
+
+PUBLIC_ROUTES = {
+    "home": "/",
+    "laws": "/laws",
+    "law_detail": "/laws/hat-compliance-act",
+    "permits": "/permits",
+    "permit": "/permit",
+    "documents": "/documents",
+    "health": "/health",
+}
+
+ADMIN_ROUTES = {
+    "admin_page": "/admin",
+    "admin_detail": "/admin/app/1",
+    "admin_dashboard": "/admin/dashboard",
+    "admin_export_csv": "/admin/export?format=csv",
+    "server_status": "/admin/server/status",
+}
+
+def register_get(name, path, admin):
+    async def run(ctx):
+        client = ctx.admin_client if admin else ctx.client
+        return await measure(lambda i: client.get(path), ctx.args.requests, ctx.args.concurrency)
+    SCENARIOS[name] = run
+
+for _name, _path in PUBLIC_ROUTES.items():
+    register_get(_name, _path, admin=False)
+for _name, _path in ADMIN_ROUTES.items():
+    register_get(_name, _path, admin=True)
+
+@scenario("document_detail")
+async def bench_document_detail(ctx):
+    document_id = ctx.main.documents_data[0]["id"]
+    return await measure(lambda i: ctx.client.get(f"/documents/{document_id}"), ctx.args.requests, ctx.args.concurrency)
+
+@scenario("submit_permit")
+async def bench_submit_permit(ctx):
+    def submit(i):
+        files = [("supporting_files", (f"petition_{i}.txt", b"I hereby petition the council. " * 64, "text/plain"))]
+        return ctx.client.post("/submit-permit", data=permit_form(i), files=files)
+    return await measure(submit, ctx.args.requests, ctx.args.concurrency)
+
+@scenario("oauth_callback")
+async def bench_oauth_callback(ctx):
+    async def login(i):
+        response = await ctx.client.get("/auth/discord/callback", params={"code": f"bench-{i}"})
+        if response.status_code != 307:
+            raise RuntimeError(f"Unexpected callback status {response.status_code}")
+        return response
+    return await measure(login, ctx.args.requests, ctx.args.concurrency)
+
+@scenario("preview_worker")
+async def bench_preview_worker(ctx):
+    from concurrent.futures import ProcessPoolExecutor
+    from PIL import Image
+    import previews
+
+    count = max(ctx.args.requests // 10, 8)
+    src_dir = tempfile.mkdtemp(prefix="previews-src-", dir=".")
+    raw_bytes = 0
+    jobs = []
+    for i in range(count):
+        src = os.path.join(src_dir, f"scan_{i}.png")
+        Image.effect_noise((1600, 1200), 64).convert("RGB").save(src, "PNG")
+        raw_bytes += os.path.getsize(src)
+        jobs.append((src, f"{src}.webp"))
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=previews.PREVIEW_WORKERS) as pool:
+        start = time.perf_counter()
+        await asyncio.gather(*(loop.run_in_executor(pool, previews.render_preview, src, dst) for src, dst in jobs))
+        elapsed = time.perf_counter() - start
+
+    preview_bytes = sum(os.path.getsize(dst) for _, dst in jobs)
+    return {
+        "items_per_s": count / elapsed,
+        # Detail-page image payload with previews relative to the full-size files
+        "payload_ratio": preview_bytes / raw_bytes,
+    }
+
+@scenario("dashboard_stats")
+async def bench_dashboard_stats(ctx):
+    # Rollup table reads versus the equivalent GROUP BY over the full table;
+    # run with --rows 1000000 for the 1M-row comparison. Raises if the
+    # free-text top list stops reading from its index.
+    from sqlalchemy import func, select
+    from database import database, engine_sync, PermitApplication
+    import stats
+
+    with engine_sync.connect() as conn:
+        compiled = stats.other_texts_query().compile(engine_sync, compile_kwargs={"literal_binds": True})
+        plan = " ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}"))
+    if "ix_permit_stats_dimension_count" not in plan or "TEMP B-TREE" in plan:
+        raise RuntimeError(f"Top other_permit_text query does not use its index: {plan}")
+
+    group_by = [
+        select(PermitApplication.permit_type, func.count()).group_by(PermitApplication.permit_type),
+        select(func.date(PermitApplication.submitted_at), func.count()).group_by(func.date(PermitApplication.submitted_at)),
+        select(PermitApplication.other_permit_text, func.count())
+        .where(PermitApplication.permit_type == "Other")
+        .group_by(PermitApplication.other_permit_text),
+    ]
+    runs = max(ctx.args.requests // 20, 3)
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        await stats.load_dashboard()
+    rollup_ms = (time.perf_counter() - start) / runs * 1000
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        for query in group_by:
+            await database.fetch_all(query)
+    group_by_ms = (time.perf_counter() - start) / runs * 1000
+
+    return {"rollup_ms": rollup_ms, "group_by_ms": group_by_ms}
+
+@scenario("bulk_review")
+async def bench_bulk_review(ctx):
+    # One executemany transaction versus one UPDATE per application
+    from sqlalchemy import update
+    from database import database, PermitApplication
+    import review
+
+    ids = [row[0] for row in await database.fetch_all(
+        "SELECT id FROM permit_applications ORDER BY id LIMIT 10000")]
+
+    start = time.perf_counter()
+    await review.apply_decisions([(application_id, "approve") for application_id in ids], "bench")
+    bulk_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for application_id in ids:
+        await database.execute(
+            update(PermitApplication)
+            .where(PermitApplication.id == application_id)
+            .values(status="pending", reviewer=None, decided_at=None)
+        )
+    single_ms = (time.perf_counter() - start) * 1000
+
+    return {"bulk_ms": bulk_ms, "one_at_a_time_ms": single_ms}
+
+@scenario("detail_cache")
+async def bench_detail_cache(ctx):
+    # Concurrent admins reopening a hot set of application pages, with the
+    # detail cache disabled and then enabled. Raises if a review decision
+    # is not visible on the next view, including when the decision lands
+    # while a read is in flight and another request shares that read.
+    from database import database
+    import detailcache
+
+    ids = [row[0] for row in await database.fetch_all(
+        "SELECT id FROM permit_applications ORDER BY id DESC LIMIT 50")]
+
+    def view(i):
+        return ctx.admin_client.get(f"/admin/app/{ids[i % len(ids)]}")
+
+    size = detailcache.DETAIL_CACHE_SIZE
+    detailcache.clear()
+    detailcache.DETAIL_CACHE_SIZE = 0
+    try:
+        uncached = await measure(view, ctx.args.requests, ctx.args.concurrency)
+    finally:
+        detailcache.DETAIL_CACHE_SIZE = size
+    before = dict(detailcache.cache_stats)
+    cached = await measure(view, ctx.args.requests, ctx.args.concurrency)
+    after = {name: detailcache.cache_stats[name] - before[name] for name in before}
+    lookups = after["hits"] + after["rerenders"] + after["misses"] + after["coalesced"]
+
+    await ctx.admin_client.post("/admin/applications/bulk", json={"decisions": [{"id": ids[0], "action": "reject"}]})
+    if "Rejected" not in (await ctx.admin_client.get(f"/admin/app/{ids[0]}")).text:
+        raise RuntimeError("Detail page still cached after a review decision")
+
+    # The first view reads the record and is held until the decision has
+    # committed; the second view starts after it and shares that read
+    await ctx.admin_client.post("/admin/applications/bulk", json={"decisions": [{"id": ids[1], "action": "approve"}]})
+    detailcache.clear()
+    fetch, decided = ctx.main.fetch_application, asyncio.Event()
+
+    async def fetch_then_wait(application_id):
+        record = await fetch(application_id)
+        await decided.wait()
+        return record
+
+    ctx.main.fetch_application = fetch_then_wait
+    try:
+        first = asyncio.create_task(ctx.admin_client.get(f"/admin/app/{ids[1]}"))
+        while ids[1] not in detailcache._loading:
+            await asyncio.sleep(0.001)
+        await ctx.admin_client.post("/admin/applications/bulk", json={"decisions": [{"id": ids[1], "action": "reject"}]})
+        coalesced = detailcache.cache_stats["coalesced"]
+        second = asyncio.create_task(ctx.admin_client.get(f"/admin/app/{ids[1]}"))
+        while detailcache.cache_stats["coalesced"] == coalesced:
+            await asyncio.sleep(0.001)
+        decided.set()
+        await asyncio.gather(first, second)
+    finally:
+        ctx.main.fetch_application = fetch
+    if "Rejected" not in (await ctx.admin_client.get(f"/admin/app/{ids[1]}")).text:
+        raise RuntimeError("A read shared across a review decision was cached")
+
+    return {
+        "uncached_p50_ms": uncached["p50_ms"],
+        "uncached_rps": uncached["rps"],
+        **cached,
+        "hit_rate": after["hits"] / lookups,
+        "db_reads": after["misses"],
+    }
+
+@scenario("webhook_burst")
+async def bench_webhook_burst(ctx):
+    # A burst of submissions delivered through the mock webhook, more than
+    # the buffer holds so part of it goes through the spool. Raises unless
+    # every notification arrives exactly once; reports the slowest
+    # publish(), which runs on the submission path.
+    import re
+    import mock_discord
+    import notify
+
+    def delivered():
+        return [int(i) for message in mock.state.webhook_messages
+                for i in re.findall(r"Bench Pirate (\d+)\*\*", message["content"])]
+
+    mock = mock_discord.create_app(ctx.main.ALLOWED_ROLE_IDS)
+    server, url = mock_discord.serve_in_thread(mock)
+    notify.DISCORD_WEBHOOK_URL = f"{url}/webhooks/1/bench"
+    notify.COALESCE_SECONDS = 0.05
+    count = ctx.args.requests * 5
+    try:
+        await notify.start()
+        start = time.perf_counter()
+        slowest_publish = 0.0
+        for i in range(count):
+            publish_start = time.perf_counter()
+            notify.publish({"id": i, "full_name": f"Bench Pirate {i}", "permit_type": "Trade Permit"})
+            slowest_publish = max(slowest_publish, time.perf_counter() - publish_start)
+        deadline = time.monotonic() + 60
+        while len(delivered()) < count and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+    finally:
+        await notify.stop()
+        notify.DISCORD_WEBHOOK_URL = None
+        server.should_exit = True
+
+    if sorted(delivered()) != list(range(count)):
+        raise RuntimeError(f"Delivered {len(delivered())} notifications ({len(set(delivered()))} distinct) of {count}")
+    return {
+        "items_per_s": count / elapsed,
+        "messages": len(mock.state.webhook_messages),
+        "max_publish_us": slowest_publish * 1e6,
+    }
+
+@scenario("job_recovery")
+async def bench_job_recovery(ctx):
+    # A job left "running" by a worker that died is claimed again once its
+    # lease expires, a failing handler is retried after a backoff, and
+    # enqueueing an existing key does nothing. Raises if any of that does
+    # not happen; reports how long recovery and the retry took.
+    import uuid
+    from sqlalchemy import delete, func, select, update
+    from database import database, Job
+    import jobs
+
+    runs = {"recover": 0, "flaky": 0}
+
+    async def recover(payload):
+        runs["recover"] += 1
+
+    async def flaky(payload):
+        runs["flaky"] += 1
+        if runs["flaky"] == 1:
+            raise RuntimeError("first attempt fails")
+
+    async def job(key):
+        return await database.fetch_one(select(Job).where(Job.idempotency_key == key))
+
+    suffix = uuid.uuid4().hex
+    recover_key, flaky_key = f"bench-recover-{suffix}", f"bench-flaky-{suffix}"
+    jobs.handler("bench_recover")(recover)
+    jobs.handler("bench_flaky")(flaky)
+    # The "crash": workers stop with a job claimed but not finished
+    await jobs.stop()
+    try:
+        await jobs.enqueue("bench_recover", {}, key=recover_key)
+        await database.execute(
+            update(Job).where(Job.idempotency_key == recover_key)
+            .values(state="running", attempts=1, locked_until=time.time() - 1)
+        )
+        await jobs.enqueue("bench_recover", {}, key=recover_key)
+        rows = await database.fetch_val(select(func.count()).select_from(Job).where(Job.idempotency_key == recover_key))
+        if rows != 1 or (await job(recover_key))["state"] != "running":
+            raise RuntimeError("Enqueueing an existing key changed the queue")
+        await jobs.enqueue("bench_flaky", {}, key=flaky_key)
+
+        # The restart
+        start = time.perf_counter()
+        await jobs.start()
+        recovered_s = retried_s = None
+        while time.perf_counter() - start < 10 + 2 * jobs.BACKOFF_BASE:
+            if recovered_s is None and (await job(recover_key))["state"] == "done":
+                recovered_s = time.perf_counter() - start
+            if retried_s is None and (await job(flaky_key))["state"] == "done":
+                retried_s = time.perf_counter() - start
+            if recovered_s is not None and retried_s is not None:
+                break
+            await asyncio.sleep(0.02)
+        recovered, retried = await job(recover_key), await job(flaky_key)
+        if recovered["state"] != "done" or recovered["attempts"] != 2 or runs["recover"] != 1:
+            raise RuntimeError(f"Expired job not recovered: {dict(recovered)}, ran {runs['recover']} times")
+        if retried["state"] != "done" or retried["attempts"] != 2 or "first attempt fails" not in (retried["last_error"] or ""):
+            raise RuntimeError(f"Failing job not retried: {dict(retried)}")
+        if retried_s < 0.5 * jobs.BACKOFF_BASE:
+            raise RuntimeError(f"Retry ran after {retried_s:.3f}s, before its backoff")
+
+        await jobs.enqueue("bench_recover", {}, key=recover_key)
+        await asyncio.sleep(jobs.POLL_INTERVAL)
+        if runs["recover"] != 1 or (await job(recover_key))["state"] != "done":
+            raise RuntimeError("Enqueueing a finished job's key ran it again")
+    finally:
+        jobs.HANDLERS.pop("bench_recover", None)
+        jobs.HANDLERS.pop("bench_flaky", None)
+        await database.execute(delete(Job).where(Job.idempotency_key.in_([recover_key, flaky_key])))
+        if not jobs._tasks:
+            await jobs.start()
+
+    return {"recovered_ms": recovered_s * 1000, "retried_ms": retried_s * 1000}
+
+@scenario("archive_hot_query")
+async def bench_archive_hot_query(ctx):
+    # Admin list query on the live table before and after archiving the
+    # oldest 90% of rows, run against a copy of the benchmark database
+    import shutil
+    from sqlalchemy import create_engine, select
+    from database import PermitApplication, engine_sync
+    import archive
+
+    # Fold the WAL into the main file so the copy has every row
+    with engine_sync.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    shutil.copy("permit_applications.db", "archive_bench.db")
+    engine = create_engine("sqlite:///./archive_bench.db")
+    list_query = select(PermitApplication).order_by(PermitApplication.application_date.desc())
+    runs = max(ctx.args.requests // 20, 3)
+
+    def time_list():
+        with engine.connect() as conn:
+            start = time.perf_counter()
+            for _ in range(runs):
+                conn.execute(list_query).fetchall()
+            return (time.perf_counter() - start) / runs * 1000
+
+    def archive_oldest():
+        with engine.connect() as conn:
+            ids = conn.execute(select(PermitApplication.id).order_by(PermitApplication.id)).scalars().all()
+        cutoff = ids[int(len(ids) * 0.9) - 1]
+        return archive.archive_where(PermitApplication.id <= cutoff, engine)
+
+    before_ms = await asyncio.to_thread(time_list)
+    await asyncio.to_thread(archive_oldest)
+    after_ms = await asyncio.to_thread(time_list)
+    engine.dispose()
+    os.remove("archive_bench.db")
+    return {"hot_list_before_ms": before_ms, "hot_list_after_ms": after_ms}
+
+@scenario("admin_page_streaming")
+async def bench_admin_page_streaming(ctx):
+    # httpx's ASGI transport buffers the whole body, so drive the app
+    # directly to see when the first chunk leaves. Also reports how much
+    # the process peak RSS grew while rendering the full list.
+    import resource
+
+    cookie = "; ".join(f"{name}={value}" for name, value in ctx.admin_client.cookies.items())
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/admin", "raw_path": b"/admin",
+        "root_path": "", "query_string": b"", "server": ("testserver", 80), "client": ("127.0.0.1", 1),
+        "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+    }
+
+    async def one():
+        start = time.perf_counter()
+        first = None
+        requested = False
+
+        async def receive():
+            # After the body, block like a client that stays connected
+            nonlocal requested
+            if requested:
+                await asyncio.Event().wait()
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            nonlocal first
+            if message["type"] == "http.response.body" and message.get("body") and first is None:
+                first = time.perf_counter() - start
+
+        await ctx.main.app(dict(scope), receive, send)
+        return first, time.perf_counter() - start
+
+    runs = max(ctx.args.requests // 20, 3)
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = [await one() for _ in range(runs)]
+    peak_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {
+        "ttfb_ms": statistics.median(first for first, _ in timings) * 1000,
+        "total_ms": statistics.median(total for _, total in timings) * 1000,
+        "peak_rss_growth_kb": peak_after - peak_before,
+    }
+
+# Peak memory the export may add on top of the running process, whatever
+# the row count; streaming keeps it to a few chunks
+EXPORT_RSS_CAP_KB = 64 * 1024
+
+def current_rss_kb():
+    # ru_maxrss only ever rises, so an earlier scenario's peak can hide
+    # growth here; /proc gives the live figure where it exists
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return None
+
+@scenario("export_memory")
+async def bench_export_memory(ctx):
+    # Streams the full CSV and NDJSON exports straight through the app (the
+    # httpx transport would hold the whole body) and raises if the peak or
+    # sampled RSS grows by more than EXPORT_RSS_CAP_KB, or rows go missing.
+    # Run with --rows 1000000 --only export_memory for the 1M-row check.
+    import resource
+    from sqlalchemy import func, select
+    from database import database, PermitApplication
+
+    rows = await database.fetch_val(select(func.count()).select_from(PermitApplication))
+    cookie = "; ".join(f"{name}={value}" for name, value in ctx.admin_client.cookies.items())
+    results = {}
+
+    for export_format in ("csv", "ndjson"):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": "/admin/export", "raw_path": b"/admin/export",
+            "root_path": "", "query_string": f"format={export_format}".encode(),
+            "server": ("testserver", 80), "client": ("127.0.0.1", 1),
+            "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+        }
+        received = {"bytes": 0, "lines": 0, "peak_kb": current_rss_kb()}
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if requested:
+                await asyncio.Event().wait()
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start" and message["status"] != 200:
+                raise RuntimeError(f"Export returned {message['status']}")
+            if message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                received["bytes"] += len(body)
+                received["lines"] += body.count(b"\n")
+                rss = current_rss_kb()
+                if rss is not None and rss > received["peak_kb"]:
+                    received["peak_kb"] = rss
+
+        rss_before = current_rss_kb()
+        peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        await ctx.main.app(scope, receive, send)
+        elapsed = time.perf_counter() - start
+        peak_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak_before
+        sampled_growth = received["peak_kb"] - rss_before if rss_before is not None else 0
+
+        # Every NDJSON record is one line; CSV lines can also come from
+        # newlines inside quoted answers, so only a floor is checked
+        if (export_format == "ndjson" and received["lines"] != rows) or received["lines"] < rows:
+            raise RuntimeError(f"{export_format} export sent {received['lines']} lines for {rows} rows")
+        if max(peak_growth, sampled_growth) > EXPORT_RSS_CAP_KB:
+            raise RuntimeError(
+                f"{export_format} export of {rows} rows grew RSS by {max(peak_growth, sampled_growth)} KiB, "
+                f"cap {EXPORT_RSS_CAP_KB} KiB"
+            )
+        results[f"{export_format}_rows_per_s"] = rows / elapsed
+        results[f"{export_format}_mb"] = received["bytes"] / 1e6
+        results[f"{export_format}_rss_growth_kb"] = max(peak_growth, sampled_growth)
+
+    return results
+
+@scenario("server_ping")
+async def bench_server_ping(ctx):
+    # Full Server List Ping exchange against the local fake server
+    import serverstatus
+
+    host, port = ctx.main.SERVER_IP, ctx.main.SERVER_PORT
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(ctx.args.requests):
+        started = time.perf_counter()
+        await serverstatus.ping(host, port)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies, time.perf_counter() - start, [0])
+
+@scenario("server_history")
+async def bench_server_history(ctx):
+    # History endpoint with the ring buffer full (a day of samples)
+    import random
+    import serverstatus
+
+    history = serverstatus.History(serverstatus.history.capacity)
+    now = time.time()
+    step = serverstatus.HISTORY_SECONDS / history.capacity
+    for n in range(history.capacity):
+        online = random.random() > 0.05
+        history.append(now - serverstatus.HISTORY_SECONDS + n * step, online, random.randint(0, 40), random.uniform(5, 80))
+    saved, serverstatus.history = serverstatus.history, history
+    try:
+        return await measure(
+            lambda i: ctx.admin_client.get("/admin/server/history?points=144"),
+            ctx.args.requests, ctx.args.concurrency
+        )
+    finally:
+        serverstatus.history = saved
+
+@scenario("submit_during_backup")
+async def bench_submit_during_backup(ctx):
+    # Submit latency on its own and while an online backup runs. Use
+    # --backup-pad-mb to grow the database to a realistic size first.
+    import sqlite3
+    import backup
+
+    if ctx.args.backup_pad_mb:
+        conn = sqlite3.connect(backup.DATABASE_PATH, isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS bench_padding (data BLOB)")
+        conn.execute(
+            "WITH RECURSIVE r(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM r WHERE i < ?) "
+            "INSERT INTO bench_padding SELECT randomblob(1048576) FROM r",
+            (ctx.args.backup_pad_mb,)
+        )
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+
+    def submit(i):
+        return ctx.client.post("/submit-permit", data=permit_form(i))
+
+    async def submit_until(done, minimum):
+        latencies = []
+
+        async def worker(w):
+            i = w
+            while not done() or len(latencies) < minimum:
+                start = time.perf_counter()
+                response = await submit(i)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+                i += ctx.args.concurrency
+
+        await asyncio.gather(*(worker(w) for w in range(ctx.args.concurrency)))
+        return sorted(latencies)
+
+    def p99(latencies):
+        return latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000
+
+    idle = await submit_until(lambda: True, ctx.args.requests)
+    backup_task = asyncio.ensure_future(asyncio.to_thread(backup.create_backup, backup_dir="bench_backups"))
+    during = await submit_until(backup_task.done, ctx.args.requests // 4)
+    snapshot = await backup_task
+
+    return {
+        "db_mb": os.path.getsize(backup.DATABASE_PATH) / 1048576,
+        "backup_s": backup.backup_stats["last_backup_seconds"],
+        "idle_p99_ms": p99(idle),
+        "during_p50_ms": statistics.median(during) * 1000,
+        "during_p99_ms": p99(during),
+        "snapshot_ok": float(backup.verify(snapshot) is None),
+    }
+
+@scenario("audit_overhead")
+async def bench_audit_overhead(ctx):
+    # Admin detail page with audit recording switched off and on, plus the
+    # cost of writing the buffered events, which happens off the request path.
+    # The detail cache is off for both passes, or the first would warm it
+    # for the second.
+    import audit
+    import detailcache
+
+    def detail(i):
+        return ctx.admin_client.get(f"/admin/app/{i % ctx.args.rows + 1}")
+
+    size = detailcache.DETAIL_CACHE_SIZE
+    detailcache.clear()
+    detailcache.DETAIL_CACHE_SIZE = 0
+    try:
+        record = audit.record
+        audit.record = lambda *args, **kwargs: None
+        try:
+            off = await measure(detail, ctx.args.requests, ctx.args.concurrency)
+        finally:
+            audit.record = record
+        await audit.flush()
+        on = await measure(detail, ctx.args.requests, ctx.args.concurrency)
+    finally:
+        detailcache.DETAIL_CACHE_SIZE = size
+    buffered = audit.metrics()["buffered"]
+    await audit.flush()
+
+    return {
+        "off_p50_ms": off["p50_ms"],
+        "on_p50_ms": on["p50_ms"],
+        "off_p95_ms": off["p95_ms"],
+        "on_p95_ms": on["p95_ms"],
+        "flush_us_per_event": audit.audit_stats["last_flush_ms"] * 1000 / max(buffered, 1),
+    }
+
+@scenario("duplicate_submissions")
+async def bench_duplicate_submissions(ctx):
+    # Simultaneous identical posts, with and without a form token, must
+    # create exactly one application and one set of files each, and a
+    # token sent again with edited answers must be refused rather than
+    # answered with the first result. A form sent again after its file was
+    # uploaded again under a new resumable upload id (what permit.html
+    # does on every submit) is also a duplicate. Raises if not; reports
+    # how long the burst and a later retry took.
+    import base64
+    import idempotency
+    import storage
+    from sqlalchemy import func, select
+    from database import database, PermitApplication
+
+    copies = max(ctx.args.concurrency, 2)
+
+    async def burst(label, token):
+        data = permit_form(0)
+        data["full_name"] = f"Duplicate {label}"
+        if token:
+            data["submission_token"] = token
+        petition = f"Petition {label} ".encode() * 4096
+
+        def post():
+            files = [("supporting_files", (f"dup_{label}.txt", petition, "text/plain"))]
+            return ctx.client.post("/submit-permit", data=data, files=files)
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(post() for _ in range(copies)))
+        elapsed = time.perf_counter() - start
+        if any(r.status_code != 200 for r in responses) or len({r.text for r in responses}) != 1:
+            raise RuntimeError(f"{label}: duplicate posts got different responses")
+
+        # A retry after the cache is gone is answered from the unique index
+        idempotency._results.clear()
+        retry_start = time.perf_counter()
+        retry = await post()
+        retry_elapsed = time.perf_counter() - retry_start
+        if retry.text != responses[0].text:
+            raise RuntimeError(f"{label}: retry after cache expiry got a different response")
+        if token:
+            edited = await ctx.client.post("/submit-permit", data={**data, "permit_details": "Edited after submitting"},
+                                           files=[("supporting_files", (f"dup_{label}.txt", petition, "text/plain"))])
+            if edited.status_code != 409:
+                raise RuntimeError(f"{label}: edited resubmission got {edited.status_code}, expected 409")
+
+        rows = await database.fetch_val(
+            select(func.count()).select_from(PermitApplication).where(PermitApplication.full_name == data["full_name"])
+        )
+        files = [name for name in os.listdir(storage.UPLOAD_DIR)
+                 if storage.logical_name(name).endswith(f"_dup_{label}.txt")]
+        if rows != 1 or len(files) != 1:
+            raise RuntimeError(f"{label}: {copies} duplicate posts created {rows} rows and {len(files)} files")
+        return elapsed, retry_elapsed
+
+    async def reupload(label, token):
+        data = {**permit_form(0), "full_name": f"Duplicate resumed {label}"}
+        if token:
+            data["submission_token"] = token
+        petition = f"Resumed petition {label} ".encode() * 4096
+        tus = {"Tus-Resumable": "1.0.0"}
+
+        async def upload():
+            created = await ctx.client.post("/uploads", headers={
+                **tus, "Upload-Length": str(len(petition)),
+                "Upload-Metadata": "filename " + base64.b64encode(f"resumed_{label}.txt".encode()).decode()
+            })
+            location = created.headers["Location"]
+            await ctx.client.patch(location, content=petition, headers={
+                **tus, "Upload-Offset": "0", "Content-Type": "application/offset+octet-stream"
+            })
+            return location.rsplit("/", 1)[1]
+
+        first_id = await upload()
+        first = await ctx.client.post("/submit-permit", data={**data, "upload_ids": first_id})
+        again = await ctx.client.post("/submit-permit", data={**data, "upload_ids": await upload()})
+        # The same post repeated, after the first submission used its upload
+        idempotency._results.clear()
+        repeated = await ctx.client.post("/submit-permit", data={**data, "upload_ids": first_id})
+        if first.status_code != 200 or {again.text, repeated.text} != {first.text}:
+            raise RuntimeError(
+                f"resumed {label}: resending the same file got {again.status_code}/{repeated.status_code}, expected the first result"
+            )
+
+        rows = await database.fetch_val(
+            select(func.count()).select_from(PermitApplication).where(PermitApplication.full_name == data["full_name"])
+        )
+        files = [name for name in os.listdir(storage.UPLOAD_DIR)
+                 if storage.logical_name(name).endswith(f"_resumed_{label}.txt")]
+        if rows != 1 or len(files) != 1:
+            raise RuntimeError(f"resumed {label}: re-uploads created {rows} rows and {len(files)} files")
+
+    token_burst, token_retry = await burst("token", idempotency.new_token())
+    fingerprint_burst, fingerprint_retry = await burst("fingerprint", None)
+    await reupload("token", idempotency.new_token())
+    await reupload("fingerprint", None)
+    return {
+        "token_burst_ms": token_burst * 1000,
+        "token_retry_ms": token_retry * 1000,
+        "fingerprint_burst_ms": fingerprint_burst * 1000,
+        "fingerprint_retry_ms": fingerprint_retry * 1000,
+    }
+
+@scenario("resumable_upload")
+async def bench_resumable_upload(ctx):
+    # A large file sent in chunks, with one chunk cut off by a dropped
+    # connection half way, then resumed from the offset the server reports
+    # and used in a submission. Raises if anything is lost or duplicated;
+    # reports throughput against a plain multipart submission.
+    import base64
+    import hashlib
+    import storage
+    import uploads
+
+    size, chunk_size = 16 * 1024 * 1024, 4 * 1024 * 1024
+    payload = os.urandom(size)
+    tus = {"Tus-Resumable": "1.0.0"}
+
+    async def patch_until_disconnect(path, offset, body, deliver):
+        # Raw ASGI call: deliver part of the body, then drop the connection
+        messages = [
+            {"type": "http.request", "body": body[:deliver], "more_body": True},
+            {"type": "http.disconnect"},
+        ]
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "PATCH", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "root_path": "", "query_string": b"", "server": ("testserver", 80), "client": ("127.0.0.1", 1),
+            "headers": [
+                (b"host", b"testserver"), (b"tus-resumable", b"1.0.0"),
+                (b"content-type", b"application/offset+octet-stream"),
+                (b"upload-offset", str(offset).encode()), (b"content-length", str(len(body)).encode()),
+            ],
+        }
+        await ctx.main.app(scope, receive, send)
+
+    start = time.perf_counter()
+    created = await ctx.client.post("/uploads", headers={
+        **tus, "Upload-Length": str(size), "Upload-Metadata": "filename " + base64.b64encode(b"chart.bin").decode()
+    })
+    if created.status_code != 201:
+        raise RuntimeError(f"Upload creation failed: {created.status_code}")
+    location = created.headers["Location"]
+
+    offset, interrupted = 0, False
+    while offset < size:
+        chunk = payload[offset:offset + chunk_size]
+        if not interrupted and offset >= size // 2:
+            interrupted = True
+            await patch_until_disconnect(location, offset, chunk, len(chunk) // 3)
+            head = await ctx.client.head(location, headers=tus)
+            resumed = int(head.headers["Upload-Offset"])
+            if resumed != offset + len(chunk) // 3:
+                raise RuntimeError(f"Expected to resume at {offset + len(chunk) // 3}, server says {resumed}")
+            stale = await ctx.client.patch(location, content=b"x", headers={
+                **tus, "Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"
+            })
+            if stale.status_code != 409:
+                raise RuntimeError(f"PATCH at a stale offset returned {stale.status_code}")
+            offset = resumed
+            continue
+        digest = base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+        response = await ctx.client.patch(location, content=chunk, headers={
+            **tus, "Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream",
+            "Upload-Checksum": f"sha256 {digest}"
+        })
+        if response.status_code != 204:
+            raise RuntimeError(f"PATCH failed: {response.status_code} {response.text}")
+        offset = int(response.headers["Upload-Offset"])
+
+    data = {**permit_form(0), "full_name": "Resumable Uploader", "upload_ids": location.rsplit("/", 1)[1]}
+    submitted = await ctx.client.post("/submit-permit", data=data)
+    resumable_seconds = time.perf_counter() - start
+    if submitted.status_code != 200:
+        raise RuntimeError(f"Submission with upload id failed: {submitted.status_code} {submitted.text[:200]}")
+    stored = [name for name in os.listdir(storage.UPLOAD_DIR) if name.endswith("_chart.bin")]
+    if len(stored) != 1:
+        raise RuntimeError(f"Expected one stored file, found {len(stored)}")
+    with open(os.path.join(storage.UPLOAD_DIR, stored[0]), "rb") as f:
+        if hashlib.sha256(f.read()).digest() != hashlib.sha256(payload).digest():
+            raise RuntimeError("Stored file differs from the uploaded bytes")
+    if (await ctx.client.head(location, headers=tus)).status_code != 404:
+        raise RuntimeError("Partial upload was not removed after the submission")
+
+    # Declared bytes of unclaimed uploads are capped per client and overall
+    def create_upload(length):
+        return ctx.client.post("/uploads", headers={**tus, "Upload-Length": str(length)})
+
+    limits = uploads.CLIENT_MAX_BYTES, uploads.TOTAL_MAX_BYTES
+    total, client_bytes, _ = uploads.outstanding("127.0.0.1")
+    held = []
+    try:
+        uploads.CLIENT_MAX_BYTES = client_bytes + 100
+        held.append(await create_upload(60))
+        over_client = await create_upload(60)
+        uploads.CLIENT_MAX_BYTES, uploads.TOTAL_MAX_BYTES = limits[0], total + 100
+        over_total = await create_upload(60)
+    finally:
+        uploads.CLIENT_MAX_BYTES, uploads.TOTAL_MAX_BYTES = limits
+        for response in held:
+            uploads.terminate(response.headers["Location"].rsplit("/", 1)[1])
+    if held[0].status_code != 201 or over_client.status_code != 429 or over_total.status_code != 507:
+        raise RuntimeError(
+            f"Upload caps not enforced: {held[0].status_code}, {over_client.status_code}, {over_total.status_code}"
+        )
+
+    # Abandoned uploads are removed by the reaper once they expire
+    abandoned = await ctx.client.post("/uploads", headers={**tus, "Upload-Length": "10"})
+    expire_after, uploads.EXPIRE_AFTER = uploads.EXPIRE_AFTER, -1
+    try:
+        uploads.expire()
+    finally:
+        uploads.EXPIRE_AFTER = expire_after
+    if (await ctx.client.head(abandoned.headers["Location"], headers=tus)).status_code != 404:
+        raise RuntimeError("Expired upload was not removed")
+
+    start = time.perf_counter()
+    files = [("supporting_files", ("chart.bin", payload, "application/octet-stream"))]
+    response = await ctx.client.post("/submit-permit", data={**permit_form(1), "full_name": "Multipart Uploader"}, files=files)
+    multipart_seconds = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"Multipart submission failed: {response.status_code}")
+
+    return {
+        "resumable_mb_s": size / resumable_seconds / 1048576,
+        "multipart_mb_s": size / multipart_seconds / 1048576,
+    }
+
+@scenario("my_applications")
+async def bench_my_applications(ctx):
+    # The applicant's own list: the route on the benchmark database, then
+    # its first and a deep page on a separate --portal-rows table, with the
+    # covering index and again with it dropped. Raises if SQLite stops
+    # answering from the index alone.
+    from sqlalchemy import create_engine, select, text
+    from database import MY_APPLICATION_COLUMNS, PermitApplication
+    import mock_discord
+    import seed
+
+    route = await measure(lambda i: ctx.admin_client.get("/my/applications"), ctx.args.requests, ctx.args.concurrency)
+
+    engine = create_engine("sqlite:///./portal_bench.db")
+    await asyncio.to_thread(seed.seed_database, ctx.args.portal_rows, seed=2, engine=engine)
+    user_id = mock_discord.MOCK_USER["id"]
+    with engine.begin() as conn:
+        # One prolific applicant so there are pages to walk
+        conn.execute(text("UPDATE permit_applications SET discord_user_id = :user WHERE id % 2000 = 0"), {"user": user_id})
+        ids = conn.execute(
+            select(PermitApplication.id).where(PermitApplication.discord_user_id == user_id)
+            .order_by(PermitApplication.id.desc())
+        ).scalars().all()
+    deep_before = ids[min(len(ids) - 1, 10 * 20)]
+
+    def page_query(before):
+        query = select(*[PermitApplication.__table__.c[name] for name in MY_APPLICATION_COLUMNS]) \
+            .where(PermitApplication.discord_user_id == user_id) \
+            .order_by(PermitApplication.id.desc()).limit(21)
+        return query.where(PermitApplication.id < before) if before is not None else query
+
+    def time_pages(runs):
+        timings = {}
+        with engine.connect() as conn:
+            for label, before in (("first", None), ("deep", deep_before)):
+                start = time.perf_counter()
+                for _ in range(runs):
+                    conn.execute(page_query(before)).fetchall()
+                timings[label] = (time.perf_counter() - start) / runs * 1000
+        return timings
+
+    with engine.connect() as conn:
+        compiled = page_query(deep_before).compile(engine, compile_kwargs={"literal_binds": True})
+        plan = " ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}"))
+    if "COVERING INDEX ix_permit_applications_discord_user" not in plan:
+        raise RuntimeError(f"Lookup does not use the covering index: {plan}")
+
+    indexed = await asyncio.to_thread(time_pages, max(ctx.args.requests, 100))
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_permit_applications_discord_user")
+    scanned = await asyncio.to_thread(time_pages, 3)
+    engine.dispose()
+    os.remove("portal_bench.db")
+
+    return {
+        **route,
+        "first_page_ms": indexed["first"],
+        "deep_page_ms": indexed["deep"],
+        "first_page_no_index_ms": scanned["first"],
+        "deep_page_no_index_ms": scanned["deep"],
+    }
+
+@scenario("request_profiling")
+async def bench_request_profiling(ctx):
+    # Cost of the profiling hook on requests that do not ask for it, and a
+    # profiled admin page. Raises if an unflagged or non-admin request
+    # leaves a profile behind, or the admin one does not.
+    import profiling
+
+    document_id = ctx.main.documents_data[0]["id"]
+    scope = {"type": "http", "method": "GET", "path": f"/documents/{document_id}", "query_string": b"",
+             "headers": [(b"host", b"testserver"), (b"accept", b"text/html"), (b"cookie", b"session=x")]}
+    checks = 100000
+    start = time.perf_counter()
+    for _ in range(checks):
+        profiling.requested(scope)
+    check_us = (time.perf_counter() - start) / checks * 1e6
+
+    before = len(profiling.listing())
+    plain = await measure(lambda i: ctx.client.get(f"/documents/{document_id}"), ctx.args.requests, ctx.args.concurrency)
+    # oauth_callback may have logged ctx.client in; ask without a session
+    cookies = ctx.client.cookies
+    ctx.client.cookies = {}
+    try:
+        response = await ctx.client.get(f"/documents/{document_id}?profile=1")
+    finally:
+        ctx.client.cookies = cookies
+    if "x-profile" in response.headers or len(profiling.listing()) != before:
+        raise RuntimeError("Profile recorded for a request that should not have one")
+
+    start = time.perf_counter()
+    response = await ctx.admin_client.get("/admin?profile=1")
+    profiled_ms = (time.perf_counter() - start) * 1000
+    location = response.headers.get("x-profile")
+    if response.status_code != 200 or not location:
+        raise RuntimeError(f"Admin request was not profiled: {response.status_code}")
+    report = await ctx.admin_client.get(location)
+    if "generate_async" not in report.text:
+        raise RuntimeError("Profile does not cover template rendering")
+
+    return {**plain, "flag_check_us": check_us, "profiled_admin_ms": profiled_ms}
+
+@scenario("freeze")
+async def bench_freeze(ctx):
+    # Renders the public pages to files and runs the parity check against
+    # the live app. Raises if any frozen page differs from its response.
+    import freeze
+
+    out_dir = os.path.abspath("frozen_bench")
+    start = time.perf_counter()
+    pages, _ = await asyncio.to_thread(freeze.freeze, ctx.main, out_dir)
+    freeze_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    problems = await asyncio.to_thread(freeze.check, ctx.main, out_dir)
+    check_seconds = time.perf_counter() - start
+    if problems:
+        raise RuntimeError("Frozen pages differ from the live app: " + "; ".join(problems[:5]))
+
+    html = gz = 0
+    for root, _, names in os.walk(out_dir):
+        for name in names:
+            if name.endswith(".html.gz"):
+                gz += os.path.getsize(os.path.join(root, name))
+                html += os.path.getsize(os.path.join(root, name[:-len(".gz")]))
+    return {"pages": pages, "freeze_s": freeze_seconds, "check_s": check_seconds, "gzip_ratio": gz / html}
+
+@scenario("compressed_storage")
+async def bench_compressed_storage(ctx):
+    # Storage ratio of the zstd tier on a synthetic corpus (text petitions,
+    # uncompressed BMP/TIFF scans and PDFs, plus PNG/JPEG that sniffing
+    # should skip), and serving throughput for raw files, compressed files
+    # sent as stored (Accept-Encoding: zstd) and decompressed on the fly.
+    import io
+    import random
+    import uuid
+    import fitz  # PyMuPDF
+    from PIL import Image, ImageDraw
+    import seed
+    import storage
+
+    rng = random.Random(3)
+
+    def scan(width=1200, height=900):
+        # A page of "handwriting": dark strokes on off-white
+        image = Image.new("L", (width, height), 235)
+        draw = ImageDraw.Draw(image)
+        for row in range(40, height - 40, 28):
+            x = 60
+            while x < width - 80:
+                length = rng.randint(20, 90)
+                draw.line((x, row, x + length, row + rng.randint(-3, 3)), fill=rng.randint(20, 70), width=2)
+                x += length + rng.randint(8, 20)
+        return image
+
+    def encode(image, fmt, **options):
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **options)
+        return buffer.getvalue()
+
+    def pdf():
+        doc = fitz.open()
+        for _ in range(rng.randint(2, 6)):
+            page = doc.new_page()
+            for line in range(40):
+                page.insert_text((60, 60 + line * 18), seed.sentence(rng, 10))
+        return doc.tobytes(deflate=False)
+
+    corpus = []
+    for _ in range(20):
+        corpus.append(("petition.txt", "\n".join(seed.sentence(rng, 16) for _ in range(rng.randint(200, 2000))).encode()))
+    for _ in range(6):
+        corpus.append(("scan.bmp", encode(scan(), "BMP")))
+        corpus.append(("scan.tiff", encode(scan(), "TIFF")))
+        corpus.append(("charter.pdf", pdf()))
+        corpus.append(("map.png", encode(Image.effect_noise((600, 600), 40).convert("RGB"), "PNG")))
+        corpus.append(("portrait.jpg", encode(Image.effect_noise((800, 600), 60).convert("RGB"), "JPEG", quality=85)))
+
+    os.makedirs(storage.STAGING_DIR, exist_ok=True)
+    staged = storage.StagedUploads()
+    for name, data in corpus:
+        unique = f"{uuid.uuid4().hex}_{name}"
+        with open(os.path.join(storage.STAGING_DIR, unique), "wb") as f:
+            f.write(data)
+        staged.files.append((os.path.join(storage.STAGING_DIR, unique), unique))
+    raw_bytes = sum(len(data) for _, data in corpus)
+    start = time.perf_counter()
+    await staged.compress()
+    compress_seconds = time.perf_counter() - start
+    staged.promote()
+    stored_bytes = sum(os.path.getsize(path) for path in staged.promoted)
+    compressed = [(name, data) for (path, name), (_, data) in zip(staged.files, corpus)
+                  if path.endswith(storage.COMPRESSED_SUFFIX)]
+    if any(path.endswith(storage.COMPRESSED_SUFFIX) for (path, name) in staged.files if name.endswith((".png", ".jpg"))):
+        raise RuntimeError("Already-compressed images were compressed again")
+
+    # Uncompressed twins of the compressed files, served as plain files
+    for name, data in compressed:
+        with open(os.path.join(storage.UPLOAD_DIR, "raw_" + name), "wb") as f:
+            f.write(data)
+
+    async def serve(names, accept_encoding, expect):
+        transferred = 0
+        start = time.perf_counter()
+        for _ in range(max(ctx.args.requests // len(names), 1)):
+            for name in names:
+                async with ctx.client.stream("GET", f"/uploaded_permit_files/{name}",
+                                             headers={"Accept-Encoding": accept_encoding}) as response:
+                    body = b"".join([chunk async for chunk in response.aiter_raw()])
+                if response.headers.get("content-encoding") != expect or response.status_code != 200:
+                    raise RuntimeError(f"{name}: unexpected {response.status_code} {response.headers.get('content-encoding')}")
+                transferred += len(body)
+        elapsed = time.perf_counter() - start
+        logical = sum(len(data) for _, data in compressed) * max(ctx.args.requests // len(names), 1)
+        return logical / elapsed / 1048576, transferred
+
+    raw_mb_s, raw_sent = await serve(["raw_" + name for name, _ in compressed], "identity", None)
+    zstd_mb_s, zstd_sent = await serve([name for name, _ in compressed], "zstd", "zstd")
+    identity_mb_s, _ = await serve([name for name, _ in compressed], "gzip", None)
+
+    for path in staged.promoted + [os.path.join(storage.UPLOAD_DIR, "raw_" + name) for name, _ in compressed]:
+        os.remove(path)
+
+    return {
+        "storage_ratio": stored_bytes / raw_bytes,
+        "compress_mb_s": raw_bytes / compress_seconds / 1048576,
+        "files_compressed": len(compressed),
+        "serve_raw_mb_s": raw_mb_s,
+        "serve_zstd_passthrough_mb_s": zstd_mb_s,
+        "serve_decompressed_mb_s": identity_mb_s,
+        "passthrough_wire_ratio": zstd_sent / raw_sent,
+    }
+
+# ----- Runner -----
+
+async def run_benchmarks(args):
+    import httpx
+    import main
+    import mock_discord
+    import mock_minecraft
+    import seed
+    import stats
+    from database import engine_sync
+
+    seed.seed_database(args.rows, seed=1)
+    stats.rebuild(engine_sync)
+
+    mock_server, mock_url = mock_discord.serve_in_thread(mock_discord.create_app(main.ALLOWED_ROLE_IDS))
+    main.DISCORD_API_BASE = mock_url
+    # Point the status sampler at a local fake so it never leaves the machine
+    stop_minecraft, minecraft_port = mock_minecraft.serve_in_thread()
+    main.SERVER_IP, main.SERVER_PORT = "127.0.0.1", minecraft_port
+
+    results = {}
+    await main.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client, \
+                httpx.AsyncClient(transport=transport, base_url="http://testserver") as admin_client:
+            await admin_client.get("/auth/discord/callback", params={"code": "bench"})
+            ctx = BenchContext(args, main, client, admin_client)
+
+            for name, func in SCENARIOS.items():
+                if args.only and name not in args.only:
+                    continue
+                results[name] = await func(ctx)
+                print(f"{name:24} " + "  ".join(f"{k}={v:.3f}" for k, v in results[name].items()))
+    finally:
+        await main.app.router.shutdown()
+        mock_server.should_exit = True
+        stop_minecraft()
+
+    return results
+
+# ----- Multi-Worker Scaling -----
+
+def bench_scaling(args):
+    # Requests/sec through serve.py over real sockets for 1..N workers
+    import subprocess
+    import httpx
+    import mock_discord
+    import seed
+
+    seed.seed_database(args.rows, seed=1)
+    results = {}
+    for workers in range(1, args.scaling + 1):
+        port = mock_discord.free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(REPO_DIR, "serve.py"), "--host", "127.0.0.1",
+             "--port", str(port), "--workers", str(workers)],
+            # Status sampler points at a closed local port
+            env={**os.environ, "PYTHONPATH": REPO_DIR, "MINECRAFT_SERVER_HOST": "127.0.0.1",
+                 "MINECRAFT_SERVER_PORT": str(mock_discord.free_port())},
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    httpx.get(f"{base_url}/health")
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.2)
+
+            async def drive():
+                limits = httpx.Limits(max_connections=args.concurrency)
+                async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+                    return await measure(lambda i: client.get("/laws"), args.requests, args.concurrency)
+
+            results[f"scaling_{workers}_workers"] = asyncio.run(drive())
+            print(f"{workers} workers: {results[f'scaling_{workers}_workers']['rps']:.1f} req/s")
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if not base or metric in NOT_COMPARED:
+                continue
+            if metric.endswith(HIGHER_IS_BETTER):
+                regressed = value < base * (1 - threshold)
+            else:
+                regressed = value > base * (1 + threshold)
+            if regressed:
+                regressions.append(f"{name}.{metric}: {value:.3f} vs baseline {base:.3f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks for the Corsair Council site")
+    parser.add_argument("--rows", type=int, default=2000, help="Synthetic applications to seed")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="Run only these scenarios")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed regression as a fraction")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--portal-rows", type=int, default=20000,
+                        help="Applications to seed for the my_applications lookup")
+    parser.add_argument("--backup-pad-mb", type=int, default=0,
+                        help="Grow the database by this many MiB before submit_during_backup")
+    parser.add_argument("--scaling", type=int, metavar="N",
+                        help="Instead of the in-process scenarios, measure serve.py with 1..N workers")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_DIR)
+    # Measure the handlers, not the abuse limits
+    for name in ("SUBMIT_RATE_PER_MINUTE", "SUBMIT_BURST", "AUTH_RATE_PER_MINUTE", "AUTH_BURST",
+                 "UPLOAD_CREATE_RATE_PER_MINUTE", "UPLOAD_CREATE_BURST",
+                 "CONCURRENCY_SUBMIT", "CONCURRENCY_PUBLIC", "CONCURRENCY_ADMIN", "CONCURRENCY_UPLOAD"):
+        os.environ.setdefault(name, "1000000")
+    prepare_workdir()
+    results = bench_scaling(args) if args.scaling else asyncio.run(run_benchmarks(args))
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        # Without one the gate would pass every run
+        print(f"No baseline at {args.baseline}; record one with --update-baseline")
+        sys.exit(1)
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    if regressions:
+        print("Regressions beyond threshold:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("No regressions")
+
+if __name__ == "__main__":
+    main()
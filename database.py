@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, Index, DDL, create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from databases import Database
@@ -8,9 +8,12 @@ DATABASE_URL = "sqlite+aiosqlite:///./permit_applications.db"
 database = Database(DATABASE_URL)
 Base = declarative_base()
 
-class PermitApplication(Base):
-    __tablename__ = "permit_applications"
+# Sync DB engine for creating tables and offline commands
+SYNC_DATABASE_URL = DATABASE_URL.replace("+aiosqlite", "")
+engine_sync = create_engine(SYNC_DATABASE_URL, connect_args={"check_same_thread": False})
 
+class PermitApplicationColumns:
+    # Shared by the live table and its archive
     id = Column(Integer, primary_key=True, index=True)
     full_name = Column(String, nullable=False, index=True)
     alias = Column(String, nullable=True)
@@ -25,6 +28,140 @@ class PermitApplication(Base):
     applicant_signature = Column(String, nullable=False)
     application_date = Column(DateTime, nullable=False)
     submitted_at = Column(DateTime(timezone=True), server_default=func.now())
+    status = Column(String, nullable=False, server_default="pending")
+    reviewer = Column(String, nullable=True)
+    decided_at = Column(DateTime, nullable=True)
+    # Form token or content fingerprint; see idempotency.py
+    submission_key = Column(String, nullable=True)
+    # Hash of the answers and files, to tell a replayed token from an edited form
+    submission_fingerprint = Column(String, nullable=True)
+    # Set when the applicant was logged in with Discord; see /my/applications
+    discord_user_id = Column(String, nullable=True)
+
+# Everything the applicant's own list shows, keyed for paging by id
+MY_APPLICATION_COLUMNS = ("discord_user_id", "id", "permit_type", "status", "application_date", "decided_at")
+
+class PermitApplication(PermitApplicationColumns, Base):
+    __tablename__ = "permit_applications"
+
+    __table_args__ = (
+        Index("ix_permit_applications_status_date", "status", "application_date"),
+        Index("ux_permit_applications_submission_key", "submission_key", unique=True),
+        # Covers the /my/applications page: one range scan, no table lookups
+        Index("ix_permit_applications_discord_user", *MY_APPLICATION_COLUMNS),
+    )
+
+    def __repr__(self):
+        return f"<PermitApplication(id={self.id}, full_name='{self.full_name}', permit_type='{self.permit_type}')>"
+
+class ArchivedPermitApplication(PermitApplicationColumns, Base):
+    __tablename__ = "permit_applications_archive"
+
+    # Rows keep their original id, so /admin/app/{id} links stay valid
+    archived_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_permit_applications_archive_status_date", "status", "application_date"),
+        Index("ix_permit_applications_archive_discord_user", *MY_APPLICATION_COLUMNS),
+    )
+
+    def __repr__(self):
+        return f"<ArchivedPermitApplication(id={self.id}, full_name='{self.full_name}', permit_type='{self.permit_type}')>"
+
+class PermitStat(Base):
+    __tablename__ = "permit_stats"
+
+    # Rollup counters maintained alongside every insert, e.g.
+    # ("permit_type", "Trade Permit") or ("day", "2025-01-31")
+    dimension = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Top-N reads of one dimension, e.g. the dashboard's other_permit_text list
+        Index("ix_permit_stats_dimension_count", "dimension", "count"),
+    )
+
+    def __repr__(self):
+        return f"<PermitStat(dimension='{self.dimension}', key='{self.key}', count={self.count})>"
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    # Times are Unix timestamps so the queue can compare them cheaply
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    idempotency_key = Column(String, nullable=True, unique=True)
+    state = Column(String, nullable=False, server_default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, server_default="0")
+    run_at = Column(Float, nullable=False)
+    locked_until = Column(Float, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(Float, nullable=False)
+    finished_at = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_state_run_at", "state", "run_at"),
+    )
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, kind='{self.kind}', state='{self.state}')>"
+
+class AuditEvent(Base):
+    __tablename__ = "audit_log"
+
+    # Who looked at or exported applicant data. Written in batches by
+    # audit.py; the triggers below make the table append-only.
+    id = Column(Integer, primary_key=True)
+    at = Column(Float, nullable=False)  # Unix timestamp
+    actor_id = Column(String, nullable=False)
+    actor_name = Column(String, nullable=True)
+    action = Column(String, nullable=False)  # view, list, export
+    application_id = Column(Integer, nullable=True)
+    detail = Column(Text, nullable=True)  # JSON, e.g. the list filters
+    ip = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_audit_log_actor_id", "actor_id", "id"),
+        Index("ix_audit_log_application_id", "application_id", "id"),
+        Index("ix_audit_log_action", "action", "id"),
+    )
 
     def __repr__(self):
-        return f"<PermitApplication(id={self.id}, full_name='{self.full_name}', permit_type='{self.permit_type}')>"
\ No newline at end of file
+        return f"<AuditEvent(id={self.id}, actor_id='{self.actor_id}', action='{self.action}')>"
+
+for _operation in ("UPDATE", "DELETE"):
+    event.listen(AuditEvent.__table__, "after_create", DDL(
+        f"CREATE TRIGGER audit_log_no_{_operation.lower()} BEFORE {_operation} ON audit_log "
+        "BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END"
+    ))
+
+def migrate(engine):
+    # create_all only creates missing tables, so add columns and indexes
+    # introduced since an existing database was created.
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None and isinstance(column.server_default.arg, str):
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+def init_db(engine=engine_sync):
+    # WAL lets writers commit while a streamed admin page still holds its
+    # read cursor open; the setting is stored in the database file
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    Base.metadata.create_all(bind=engine)
+    migrate(engine)
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Read-through cache for /admin/app/{id}. Each entry holds the decoded
+# application record and the page rendered from it, keyed by id (ids are
+# shared by the live table and the archive). Review decisions and archival
+# invalidate the ids they touch; the TTL bounds how stale another worker's
+# copy can get, since each serve.py worker has its own cache. Preview
+# thumbnails appear after the fact, so the page is kept together with the
+# previews it was rendered with and re-rendered from the record when they
+# change. Concurrent misses for the same id share one database read.
+
+DETAIL_CACHE_SIZE = int(os.getenv("DETAIL_CACHE_SIZE", "500"))
+DETAIL_CACHE_TTL = float(os.getenv("DETAIL_CACHE_TTL", "60"))
+
+# Invalidation also runs on archive.py's worker thread
+_lock = threading.Lock()
+_entries = OrderedDict()  # id -> [expires at, record, previews, html]
+# Bumped by every invalidation, so a page read from the database before a
+# write but stored after it is dropped instead of cached
+_generation = 0
+_loading = {}  # id -> Future of (record, generation) for a read in progress
+
+cache_stats = {
+    "hits": 0,  # page served as cached
+    "rerenders": 0,  # record cached, page rendered again for new previews
+    "misses": 0,  # read from the database
+    "coalesced": 0,  # missed, but shared another request's read
+    "invalidations": 0,
+    "evictions": 0,
+}
+
+def get(application_id):
+    # [expires at, record, previews, html] or None
+    with _lock:
+        entry = _entries.get(application_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _entries[application_id]
+            return None
+        _entries.move_to_end(application_id)
+        return entry
+
+def generation():
+    return _generation
+
+def put(application_id, record, previews, html, read_at_generation):
+    with _lock:
+        if read_at_generation != _generation:
+            return
+        _entries[application_id] = [time.monotonic() + DETAIL_CACHE_TTL, record, previews, html]
+        _entries.move_to_end(application_id)
+        while len(_entries) > DETAIL_CACHE_SIZE:
+            _entries.popitem(last=False)
+            cache_stats["evictions"] += 1
+
+async def load(application_id, fetch):
+    # fetch(application_id) -> record or None, run once per id at a time.
+    # Returns (record, generation when the read started); pass the latter
+    # to put(), so a record shared from a read that began before an
+    # invalidation is never cached.
+    running = _loading.get(application_id)
+    if running is not None:
+        cache_stats["coalesced"] += 1
+        await asyncio.wait([running])
+        if not running.cancelled():
+            return running.result()
+        # The first reader failed; try again on this request
+        started_at = _generation
+        return await fetch(application_id), started_at
+
+    cache_stats["misses"] += 1
+    started_at = _generation
+    future = asyncio.get_running_loop().create_future()
+    _loading[application_id] = future
+    try:
+        record = await fetch(application_id)
+    except BaseException:
+        future.cancel()
+        raise
+    finally:
+        del _loading[application_id]
+    future.set_result((record, started_at))
+    return record, started_at
+
+def invalidate(application_ids):
+    global _generation
+    with _lock:
+        _generation += 1
+        for application_id in application_ids:
+            if _entries.pop(application_id, None) is not None:
+                cache_stats["invalidations"] += 1
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+def metrics():
+    lookups = sum(cache_stats[name] for name in ("hits", "rerenders", "misses", "coalesced"))
+    return {
+        "size": len(_entries),
+        "max_size": DETAIL_CACHE_SIZE,
+        "ttl": DETAIL_CACHE_TTL,
+        **cache_stats,
+        "hit_rate": round(cache_stats["hits"] / lookups, 4) if lookups else None,
+        "record_hit_rate": round((cache_stats["hits"] + cache_stats["rerenders"]) / lookups, 4) if lookups else None,
+    }
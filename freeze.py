@@ -0,0 +1,182 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+from xml.sax.saxutils import escape
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # Optional; only .gz variants are written without it
+
+# Renders the public pages (main.PUBLIC_PAGES) to plain files so nginx or a
+# CDN can serve them, leaving the app with submissions, auth and admin
+# (DRIFTSITE_DYNAMIC_ONLY=1 or serve.py --dynamic-only). The pages only
+# change on deploy, so freeze again after each one:
+#
+#   FREEZE_DIR/index.html, laws/index.html, laws/<id>/index.html, ...
+#   FREEZE_DIR/static/...            assets under their own name and a
+#                                    content-hashed name for long caching
+#   FREEZE_DIR/sitemap.xml, robots.txt, manifest.json
+#   *.gz and *.br next to anything compressible (gzip_static/brotli_static)
+#
+# An nginx server block along these lines serves the result:
+#
+#   root /srv/driftsite/frozen;
+#   location /static/ { gzip_static on; }
+#   location ~ "^/static/.+\.[0-9a-f]{12}\.[a-z0-9]+$" { gzip_static on; expires max; }
+#   location / { gzip_static on; try_files $uri/index.html $uri @app; }
+#   location @app { proxy_pass http://127.0.0.1:8000; }
+#
+# The permit form is rendered without its per-visit submission token; the
+# page's script fetches one from /permit/token. check() renders every page
+# again and compares it with the files, which catches a stale freeze.
+
+FREEZE_DIR = os.getenv("FREEZE_DIR", "frozen")
+SITE_URL = os.getenv("SITE_URL", "http://localhost:8000")
+STATIC_DIR = "static"
+COMPRESSIBLE = (".html", ".xml", ".txt", ".json", ".css", ".js", ".svg", ".ttf", ".otf")
+MIN_COMPRESS_SIZE = 256
+
+TOKEN_INPUT = re.compile(r'(name="submission_token" value=")[^"]*(")')
+STATIC_URL = re.compile(r"/static/[^\s\"'()?#]+")
+
+def page_paths(main):
+    # Every URL the public routes answer, with path parameters filled in
+    # from the data the pages are rendered from
+    parameters = {
+        "law_id": [law["id"] for law in main.laws_data],
+        "document_id": [document["id"] for document in main.documents_data],
+    }
+    paths = []
+    for route in main.app.router.routes:
+        if getattr(route, "endpoint", None) not in main.PUBLIC_PAGES:
+            continue
+        names = re.findall(r"{(\w+)}", route.path)
+        if not names:
+            paths.append(route.path)
+            continue
+        if len(names) != 1 or names[0] not in parameters:
+            raise ValueError(f"Don't know how to freeze {route.path}")
+        paths += [route.path.replace(f"{{{names[0]}}}", value) for value in parameters[names[0]]]
+    if not paths:
+        raise ValueError("No public routes to freeze; unset DRIFTSITE_DYNAMIC_ONLY")
+    return paths
+
+def page_file(path):
+    return os.path.join(*path.strip("/").split("/"), "index.html") if path.strip("/") else "index.html"
+
+def fingerprint_assets(static_dir=STATIC_DIR):
+    # {"/static/fonts/a.ttf": ("/static/fonts/a.<hash>.ttf", bytes)}
+    assets = {}
+    for root, _, names in os.walk(static_dir):
+        for name in sorted(names):
+            with open(os.path.join(root, name), "rb") as f:
+                data = f.read()
+            relative = os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/")
+            stem, extension = os.path.splitext(relative)
+            hashed = f"/static/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+            assets[f"/static/{relative}"] = (hashed, data)
+    return assets
+
+def normalize(html, assets):
+    # What the frozen copy of a live response looks like
+    html = TOKEN_INPUT.sub(r"\1\2", html)
+    return STATIC_URL.sub(lambda match: assets.get(match.group(0), (match.group(0),))[0], html)
+
+def render_pages(main, assets):
+    # No lifespan: the public pages need neither the database nor the
+    # background tasks, and a fresh client carries no session
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    pages = {}
+    for path in page_paths(main):
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+        pages[path] = normalize(response.text, assets)
+    return pages
+
+def write_file(root, relative, data):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if not relative.endswith(COMPRESSIBLE) or len(data) < MIN_COMPRESS_SIZE:
+        return
+    # mtime=0 keeps the output byte-for-byte reproducible
+    variants = [(".gz", gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+
+def sitemap(paths, site_url):
+    urls = "".join(f"  <url><loc>{escape(site_url.rstrip('/') + path)}</loc></url>\n" for path in paths)
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            f"{urls}</urlset>\n")
+
+def freeze(main, out_dir=FREEZE_DIR, site_url=SITE_URL):
+    # Built next to out_dir and swapped in, so a server reading out_dir
+    # never sees a half-written tree
+    assets = fingerprint_assets()
+    pages = render_pages(main, assets)
+    building, previous = out_dir.rstrip("/") + ".partial", out_dir.rstrip("/") + ".old"
+    for leftover in (building, previous):
+        shutil.rmtree(leftover, ignore_errors=True)
+
+    for path, html in pages.items():
+        write_file(building, page_file(path), html.encode())
+    for original, (hashed, data) in assets.items():
+        write_file(building, original.lstrip("/"), data)
+        write_file(building, hashed.lstrip("/"), data)
+    write_file(building, "sitemap.xml", sitemap(list(pages), site_url).encode())
+    write_file(building, "robots.txt", (
+        f"User-agent: *\nDisallow: /admin\nSitemap: {site_url.rstrip('/')}/sitemap.xml\n"
+    ).encode())
+    write_file(building, "manifest.json", json.dumps({
+        "pages": {path: page_file(path) for path in pages},
+        "assets": {original: hashed for original, (hashed, _) in assets.items()},
+    }, indent=2, sort_keys=True).encode())
+
+    if os.path.exists(out_dir):
+        os.rename(out_dir, previous)
+    os.rename(building, out_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+    return len(pages), len(assets)
+
+def check(main, out_dir=FREEZE_DIR):
+    # Parity between the frozen files and what the app serves now; returns
+    # a list of problems, empty when the freeze is current
+    with open(os.path.join(out_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    assets = fingerprint_assets()
+    problems = []
+
+    for original, (hashed, _) in assets.items():
+        if manifest["assets"].get(original) != hashed:
+            problems.append(f"{original}: asset changed since the freeze")
+    for path, html in render_pages(main, assets).items():
+        frozen_path = os.path.join(out_dir, page_file(path))
+        try:
+            with open(frozen_path, "rb") as f:
+                frozen = f.read().decode()
+        except FileNotFoundError:
+            problems.append(f"{path}: missing from {out_dir}")
+            continue
+        if frozen != html:
+            problems.append(f"{path}: differs from the live page")
+        gzipped = frozen_path + ".gz"
+        if os.path.exists(gzipped):
+            with open(gzipped, "rb") as f:
+                if gzip.decompress(f.read()) != frozen.encode():
+                    problems.append(f"{path}: .gz variant is stale")
+        manifest["pages"].pop(path, None)
+    problems += [f"{path}: frozen but no longer a public page" for path in manifest["pages"]]
+    return problems
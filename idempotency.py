@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import re
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Collapses retried and double-clicked permit submissions. Each request is
+# reduced to a key: the form token issued with permit.html, or, for posts
+# without one, a fingerprint of the normalized answers and file contents.
+# The first request with a key does the work; duplicates get its result
+# without writing anything. Requests that arrive while the first is still
+# running wait for it, and finished results are cached for CACHE_TTL.
+# The unique index on submission_key catches duplicates the cache cannot
+# see, e.g. ones handled by another worker. A form token can also come back
+# with different answers (the back button keeps the old token), so the
+# fingerprint is stored with every application and a token replay only
+# counts as a duplicate when it matches; see conflicts().
+
+CACHE_TTL = 600
+CACHE_MAX = 10000
+HASH_CHUNK = 1024 * 1024
+
+TOKEN_PATTERN = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+WHITESPACE = re.compile(r"\s+")
+
+_results = OrderedDict()  # key -> (expires at, result)
+_in_flight = {}  # key -> Future
+
+def new_token():
+    return secrets.token_urlsafe(16)
+
+def normalize(value):
+    return WHITESPACE.sub(" ", value or "").strip().casefold()
+
+async def fingerprint(fields, uploads, resumed=()):
+    # resumed: [(filename, sha256)] of resumable uploads, which get new ids
+    # each time the form is sent, so only their contents count
+    digest = hashlib.sha256()
+    for name in sorted(fields):
+        digest.update(f"\0{name}={normalize(fields[name])}".encode())
+    for filename, sha256 in resumed:
+        digest.update(f"\0resumed={filename}:{sha256}".encode())
+    for upload in uploads:
+        digest.update(f"\0file={upload.filename}".encode())
+        while chunk := await upload.read(HASH_CHUNK):
+            digest.update(chunk)
+        await upload.seek(0)
+    return digest.hexdigest()
+
+async def submission_key(token, fields, uploads, resumed=()):
+    # (key, fingerprint of the answers and files)
+    content = await fingerprint(fields, uploads, resumed)
+    if token and TOKEN_PATTERN.match(token):
+        return "tok:" + token, content
+    # Includes the submission day so identical answers sent on another day
+    # still count as a new application
+    day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    return "fp:" + hashlib.sha256(f"{day}\0{content}".encode()).hexdigest(), content
+
+def conflicts(result, content):
+    # A token already used for different answers. Rows from before
+    # fingerprints were stored have none and are taken as matching.
+    return result.get("fingerprint") not in (None, content)
+
+def cached(key):
+    entry = _results.get(key)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        del _results[key]
+        return None
+    return entry[1]
+
+def remember(key, result):
+    _results[key] = (time.monotonic() + CACHE_TTL, result)
+    _results.move_to_end(key)
+    while len(_results) > CACHE_MAX:
+        _results.popitem(last=False)
+
+async def run_once(key, lookup, create):
+    # Returns (result, duplicate). lookup() finds an earlier result in the
+    # database; create() does the work and may return None if it lost a
+    # race on the unique index, in which case lookup() runs again.
+    while True:
+        result = cached(key)
+        if result is not None:
+            return result, True
+        running = _in_flight.get(key)
+        if running is None:
+            break
+        # Wait for the request already handling this key. If it failed
+        # there is no cached result and this request takes over.
+        await asyncio.wait([running])
+
+    done = asyncio.get_running_loop().create_future()
+    _in_flight[key] = done
+    try:
+        result = await lookup()
+        duplicate = result is not None
+        if not duplicate:
+            result = await create()
+            if result is None:
+                result, duplicate = await lookup(), True
+        remember(key, result)
+        return result, duplicate
+    finally:
+        del _in_flight[key]
+        done.set_result(None)
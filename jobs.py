@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import database, Job
+
+logger = logging.getLogger(__name__)
+
+# SQLite-backed job queue for work that should not hold up a request.
+# Jobs survive restarts; a claimed job that is not finished within
+# VISIBILITY_TIMEOUT (e.g. because the process died) becomes visible
+# again, so handlers must be safe to run more than once.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 600.0
+POLL_INTERVAL = 1.0
+KEEP_FINISHED_FOR = 7 * 24 * 3600
+
+HANDLERS = {}
+
+_wakeup = None
+_tasks = []
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+async def enqueue(kind, payload, key=None, delay=0):
+    # Safe to call inside a caller's transaction, so the job is committed
+    # together with the row that caused it. Duplicate keys are ignored.
+    now = time.time()
+    query = sqlite_insert(Job).values(
+        kind=kind,
+        payload=json.dumps(payload),
+        idempotency_key=key,
+        run_at=now + delay,
+        created_at=now
+    ).on_conflict_do_nothing(index_elements=[Job.idempotency_key])
+    await database.execute(query)
+    if _wakeup is not None:
+        _wakeup.set()
+
+def backoff(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE ** attempts)
+    return delay * random.uniform(0.5, 1.0)
+
+async def claim():
+    now = time.time()
+    ready = (
+        select(Job.id)
+        .where(or_(
+            and_(Job.state == "queued", Job.run_at <= now),
+            and_(Job.state == "running", Job.locked_until <= now)
+        ))
+        .order_by(Job.run_at)
+        .limit(1)
+        .scalar_subquery()
+    )
+    query = (
+        update(Job)
+        .where(Job.id == ready)
+        .values(state="running", attempts=Job.attempts + 1, locked_until=now + VISIBILITY_TIMEOUT)
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts)
+    )
+    return await database.fetch_one(query)
+
+async def finish(job_id):
+    await database.execute(
+        update(Job).where(Job.id == job_id).values(state="done", locked_until=None, finished_at=time.time())
+    )
+
+async def fail(job_id, attempts, error):
+    now = time.time()
+    if attempts >= MAX_ATTEMPTS:
+        values = {"state": "failed", "finished_at": now}
+    else:
+        values = {"state": "queued", "run_at": now + backoff(attempts)}
+    await database.execute(
+        update(Job).where(Job.id == job_id).values(locked_until=None, last_error=error, **values)
+    )
+
+async def run_one():
+    job = await claim()
+    if job is None:
+        return False
+
+    func = HANDLERS.get(job["kind"])
+    try:
+        if func is None:
+            raise LookupError(f"No handler registered for job kind '{job['kind']}'")
+        await asyncio.wait_for(func(json.loads(job["payload"])), VISIBILITY_TIMEOUT)
+    except Exception as exc:
+        logger.warning("Job %s (%s) attempt %s failed: %r", job["id"], job["kind"], job["attempts"], exc)
+        await fail(job["id"], job["attempts"], repr(exc))
+    else:
+        await finish(job["id"])
+    return True
+
+async def purge_finished():
+    cutoff = time.time() - KEEP_FINISHED_FOR
+    await database.execute(delete(Job).where(Job.state == "done", Job.finished_at < cutoff))
+
+async def _worker():
+    while True:
+        try:
+            if await run_one():
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Job worker error")
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+async def _janitor():
+    while True:
+        try:
+            await purge_finished()
+        except Exception:
+            logger.exception("Failed to purge finished jobs")
+        await asyncio.sleep(3600)
+
+async def metrics():
+    now = time.time()
+    rows = await database.fetch_all(
+        select(Job.state, Job.kind, func.count().label("jobs"), func.min(Job.run_at).label("oldest"))
+        .where(Job.state.in_(["queued", "running", "failed"]))
+        .group_by(Job.state, Job.kind)
+    )
+
+    depth = {}
+    failed = {}
+    oldest_ready = None
+    for row in rows:
+        kind = row["kind"]
+        if row["state"] == "failed":
+            failed[kind] = row["jobs"]
+            continue
+        depth[kind] = depth.get(kind, 0) + row["jobs"]
+        if row["state"] == "queued" and row["oldest"] <= now:
+            oldest_ready = row["oldest"] if oldest_ready is None else min(oldest_ready, row["oldest"])
+
+    return {
+        "depth": sum(depth.values()),
+        "depth_by_kind": depth,
+        "failed_by_kind": failed,
+        # How long the oldest runnable job has been waiting for a worker
+        "lag_seconds": round(now - oldest_ready, 3) if oldest_ready is not None else 0.0,
+        "workers": len(_tasks) - 1 if _tasks else 0,
+    }
+
+async def start(workers=JOB_WORKERS):
+    global _wakeup, _tasks
+    _wakeup = asyncio.Event()
+    _tasks = [asyncio.create_task(_worker()) for _ in range(workers)]
+    _tasks.append(asyncio.create_task(_janitor()))
+
+async def stop():
+    global _wakeup, _tasks
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _wakeup, _tasks = None, []
@@ -1,18 +1,39 @@
-from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException, Depends, status
+from fastapi import FastAPI, Request, UploadFile, File, Form, Query, HTTPException, Depends, status
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse, HTMLResponse
-from sqlalchemy import create_engine, insert, select
-from database import Base, DATABASE_URL, database, PermitApplication
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, HTMLResponse, Response, StreamingResponse
+from sqlalchemy import insert, select
+from database import database, init_db, ArchivedPermitApplication, AuditEvent, PermitApplication, MY_APPLICATION_COLUMNS
 from typing import List, Optional
 from starlette.middleware.sessions import SessionMiddleware
-from datetime import datetime
+from starlette.requests import ClientDisconnect
+from datetime import datetime, timezone
+from email.utils import formatdate
+import asyncio
 import httpx
 import os
 import json
-import uuid
+import csv
+import sqlite3
+import io
+import mimetypes
 from dotenv import load_dotenv
-import socket
+from jinja2 import Environment
+import archive
+import audit
+import backup
+import detailcache
+import idempotency
+import jobs
+import notify
+import previews
+import profiling
+import serverstatus
+import stats
+import storage
+import review
+import uploads
+from ratelimit import AdmissionControlMiddleware
 
 load_dotenv()
 
@@ -29,31 +50,78 @@ ALLOWED_ROLE_IDS = {
 }
 
 # Your Minecraft server IP and port here:
-SERVER_IP = "driftofstars.falixsrv.me"  # e.g. "123.45.67.89"
-SERVER_PORT = 25565
+SERVER_IP = os.getenv("MINECRAFT_SERVER_HOST", "driftofstars.falixsrv.me")  # e.g. "123.45.67.89"
+SERVER_PORT = int(os.getenv("MINECRAFT_SERVER_PORT", "25565"))
 
-os.makedirs("uploaded_permit_files", exist_ok=True)
+os.makedirs(storage.UPLOAD_DIR, exist_ok=True)
+os.makedirs(previews.PREVIEW_DIR, exist_ok=True)
 
 app = FastAPI()
 
-app.mount("/uploaded_permit_files", StaticFiles(directory="uploaded_permit_files"), name="uploaded_permit_files")
+app.mount("/permit_previews", StaticFiles(directory=previews.PREVIEW_DIR), name="permit_previews")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Added before SessionMiddleware so they run inside it and can see the
+# session. Profiling is innermost so admission waits are not profiled; the
+# lambda defers the lookup of require_admin_roles, defined further down.
+app.add_middleware(profiling.ProfilingMiddleware, authorize=lambda request: require_admin_roles(request))
+app.add_middleware(AdmissionControlMiddleware)
 app.add_middleware(SessionMiddleware, secret_key=os.getenv("SESSION_SECRET_KEY", "your_secret_key_here"))
 
 templates = Jinja2Templates(directory="templates")
 
-# Sync DB engine for creating tables
-SYNC_DATABASE_URL = DATABASE_URL.replace("+aiosqlite", "")
-engine_sync = create_engine(SYNC_DATABASE_URL, connect_args={"check_same_thread": False})
-Base.metadata.create_all(bind=engine_sync)
+# Async twin of the template environment for streamed pages: rendering can
+# await row iterators and the response starts before the page is complete.
+stream_env = Environment(loader=templates.env.loader, autoescape=True, enable_async=True)
+stream_env.globals.update(templates.env.globals)
+STREAM_CHUNK_SIZE = 8192
+
+def stream_template(name: str, context: dict, status_code: int = 200):
+    template = stream_env.get_template(name)
+
+    async def body():
+        # Coalesce Jinja's many small fragments into socket-sized writes
+        buffer = []
+        size = 0
+        async for fragment in template.generate_async(context):
+            buffer.append(fragment)
+            size += len(fragment)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield "".join(buffer)
+
+    return StreamingResponse(body(), status_code=status_code, media_type="text/html")
+
+# serve.py creates and migrates the tables once before forking its workers
+if not os.getenv("DRIFTSITE_SKIP_CREATE_ALL"):
+    init_db()
 
 @app.on_event("startup")
 async def startup():
     await database.connect()
+    await audit.start()
+    await storage.start()
+    await uploads.start()
+    await previews.start()
+    await jobs.start()
+    await notify.start()
+    await archive.start()
+    await serverstatus.start(SERVER_IP, SERVER_PORT)
+    await backup.start()
 
 @app.on_event("shutdown")
 async def shutdown():
+    await backup.stop()
+    await serverstatus.stop()
+    await archive.stop()
+    await notify.stop()
+    await jobs.stop()
+    await previews.stop()
+    await storage.stop()
+    await audit.stop()
     await database.disconnect()
 
 # ----- Auth Helpers -----
@@ -154,7 +222,10 @@ async def callback(request: Request, code: Optional[str] = None):
         "roles": roles
     }
 
-    return RedirectResponse(url="/admin")
+    # Set by pages that sent the visitor here to log in; applicants who
+    # arrive from anywhere else go to their own list, not the admin pages
+    default_next = "/admin" if ALLOWED_ROLE_IDS.intersection(roles) else "/my/applications"
+    return RedirectResponse(url=request.session.pop("login_next", default_next))
 
 @app.get("/logout")
 async def logout(request: Request):
@@ -167,22 +238,42 @@ async def logout(request: Request):
 async def admin_dashboard(request: Request, user: dict = Depends(require_admin_roles)):
     return templates.TemplateResponse("admin_dashboard.html", {
         "request": request,
-        "user": user
+        "user": user,
+        "stats": await stats.load_dashboard()
     })
 
-# ----- New Server Status Endpoint -----
+@app.get("/admin/metrics")
+async def admin_metrics(user: dict = Depends(require_admin_roles)):
+    return {
+        "jobs": await jobs.metrics(),
+        "notifications": notify.metrics(),
+        "reaper": storage.reaper_stats,
+        "backups": backup.backup_stats,
+        "audit": audit.metrics(),
+        "detail_cache": detailcache.metrics(),
+        "upload_storage": storage.compression_metrics()
+    }
 
-def is_server_online(ip, port, timeout=2):
-    try:
-        with socket.create_connection((ip, port), timeout=timeout):
-            return True
-    except Exception:
-        return False
+# ----- New Server Status Endpoint -----
 
 @app.get("/admin/server/status")
 async def server_status(user: dict = Depends(require_admin_roles)):
-    online = is_server_online(SERVER_IP, SERVER_PORT)
-    return {"status": "Online" if online else "Offline"}
+    # Served from the background sampler; only ping here before its first run
+    latest = serverstatus.latest
+    if latest["checked_at"] is None:
+        latest = await serverstatus.sample()
+    return {"status": "Online" if latest["online"] else "Offline", **latest}
+
+@app.get("/admin/server/history")
+async def server_history(
+    hours: float = Query(24, gt=0, le=24),
+    points: int = Query(96, ge=1, le=1440),
+    user: dict = Depends(require_admin_roles)
+):
+    return {
+        "sample_interval": serverstatus.SAMPLE_INTERVAL,
+        "series": serverstatus.history.downsample(hours * 3600, points)
+    }
 
 # ----- Permit Submission -----
 
@@ -200,108 +291,588 @@ async def submit_permit(
     permit_details: Optional[str] = Form(None),
     applicant_signature: str = Form(...),
     application_date: str = Form(...),
-    supporting_files: Optional[List[UploadFile]] = File(None)
+    supporting_files: Optional[List[UploadFile]] = File(None),
+    upload_ids: Optional[List[str]] = Form(None),
+    submission_token: Optional[str] = Form(None)
 ):
-    os.makedirs("uploaded_permit_files", exist_ok=True)
-    saved_files = []
-
-    if supporting_files:
-        for upload in supporting_files:
-            if upload.filename:
-                safe_filename = os.path.basename(upload.filename)
-                unique_filename = f"{uuid.uuid4().hex}_{safe_filename}"
-                file_path = os.path.join("uploaded_permit_files", unique_filename)
-                with open(file_path, "wb") as f:
-                    f.write(await upload.read())
-                saved_files.append(unique_filename)
-
-    supporting_files_json = json.dumps(saved_files) if saved_files else None
-
     try:
         parsed_application_date = datetime.fromisoformat(application_date)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format")
 
-    query = insert(PermitApplication).values(
-        full_name=full_name,
-        alias=alias,
-        crew=crew,
-        contact_address=contact_address,
-        preferred_contact=preferred_contact,
-        other_corr_text=other_corr_text,
-        permit_type=permit_type,
-        other_permit_text=other_permit_text,
-        permit_details=permit_details,
-        applicant_signature=applicant_signature,
-        application_date=parsed_application_date,
-        supporting_files=supporting_files_json
+    values = {
+        "full_name": full_name,
+        "alias": alias,
+        "crew": crew,
+        "contact_address": contact_address,
+        "preferred_contact": preferred_contact,
+        "other_corr_text": other_corr_text,
+        "permit_type": permit_type,
+        "other_permit_text": other_permit_text,
+        "permit_details": permit_details,
+        "applicant_signature": applicant_signature,
+        # Links the application to /my/applications when logged in
+        "discord_user_id": (request.session.get("user") or {}).get("id"),
+    }
+    received_files = [upload for upload in supporting_files or [] if upload.filename]
+    # Finished resumable uploads (see /uploads) referenced by the form
+    upload_ids = [upload_id for upload_id in upload_ids or [] if upload_id]
+    try:
+        resumed = await uploads.digests(upload_ids)
+    except uploads.UploadError as exc:
+        raise HTTPException(status_code=400, detail=exc.detail)
+    key, content = await idempotency.submission_key(
+        submission_token,
+        {**values, "application_date": application_date},
+        received_files,
+        resumed
     )
 
-    await database.execute(query)
+    async def lookup():
+        query = select(
+            PermitApplication.id, PermitApplication.full_name, PermitApplication.permit_type,
+            PermitApplication.crew, PermitApplication.supporting_files, PermitApplication.submission_fingerprint
+        ).where(PermitApplication.submission_key == key)
+        row = await database.fetch_one(query)
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "full_name": row["full_name"],
+            "permit_type": row["permit_type"],
+            "crew": row["crew"],
+            "supporting_files": json.loads(row["supporting_files"] or "[]"),
+            "fingerprint": row["submission_fingerprint"]
+        }
+
+    async def create():
+        # Files are staged and only moved into uploaded_permit_files as the
+        # row commits; any failure removes everything this request wrote.
+        try:
+            resumed_files = uploads.completed(upload_ids)
+        except uploads.UploadError as exc:
+            raise HTTPException(status_code=400, detail=exc.detail)
+
+        staged = storage.StagedUploads()
+        try:
+            for upload in received_files:
+                await staged.add(upload)
+            for part_path, filename in resumed_files:
+                staged.link(part_path, filename)
+            await staged.compress()
+            saved_files = staged.filenames
+            application_id = await insert_application(
+                staged,
+                **values,
+                application_date=parsed_application_date,
+                supporting_files=json.dumps(saved_files) if saved_files else None,
+                submission_key=key,
+                submission_fingerprint=content
+            )
+        except sqlite3.IntegrityError as exc:
+            staged.discard()
+            if "submission_key" not in str(exc):
+                raise
+            # Another worker committed the same submission first
+            return None
+        except BaseException:
+            staged.discard()
+            raise
+
+        for upload_id in upload_ids:
+            uploads.consume(upload_id)
+        result = {
+            "id": application_id,
+            "full_name": full_name,
+            "permit_type": permit_type,
+            "crew": crew,
+            "supporting_files": saved_files,
+            "fingerprint": content
+        }
+        notify.publish({field: result[field] for field in ("id", "full_name", "permit_type", "crew")})
+        return result
+
+    result, duplicate = await idempotency.run_once(key, lookup, create)
+    if duplicate and idempotency.conflicts(result, content):
+        raise HTTPException(
+            status_code=409,
+            detail="This form was already submitted with different answers. Open the permit form again to send a new application."
+        )
+    if duplicate:
+        # A retry that uploaded the same files again; the first copy is stored
+        for upload_id in upload_ids:
+            uploads.consume(upload_id)
 
     return templates.TemplateResponse("submission_success.html", {
         "request": request,
-        "full_name": full_name,
-        "permit_type": permit_type,
-        "crew": crew,
-        "supporting_files": saved_files
+        "full_name": result["full_name"],
+        "permit_type": result["permit_type"],
+        "crew": result["crew"],
+        "supporting_files": result["supporting_files"],
+        "tracked": values["discord_user_id"] is not None
     })
 
-# ----- Admin View Applications -----
+# ----- Uploaded Files -----
+
+@app.api_route("/uploaded_permit_files/{filename}", methods=["GET", "HEAD"])
+async def uploaded_file(request: Request, filename: str):
+    # Files may be stored zstd-compressed (see storage.py). Clients that
+    # accept zstd get the stored bytes as they are; others get them
+    # decompressed on the fly, off the event loop.
+    stored = storage.stored_path(filename) if filename == os.path.basename(filename) else None
+    if stored is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    path, compressed = stored
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if not compressed:
+        return FileResponse(path, media_type=media_type)
+
+    headers = {"Vary": "Accept-Encoding"}
+    if storage.accepts_zstd(request.headers.get("accept-encoding")):
+        return FileResponse(path, media_type=media_type, headers={**headers, "Content-Encoding": "zstd"})
+    size = await asyncio.to_thread(storage.decompressed_size, path)
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    if request.method == "HEAD":
+        return Response(media_type=media_type, headers=headers)
+    return StreamingResponse(storage.decompressed_chunks(path), media_type=media_type, headers=headers)
+
+# ----- Resumable Uploads -----
+
+TUS_HEADERS = {"Tus-Resumable": uploads.TUS_VERSION}
+
+def upload_response(status_code, offset=None, expires_at=None, **headers):
+    headers = {**TUS_HEADERS, **headers}
+    if offset is not None:
+        headers["Upload-Offset"] = str(offset)
+    if expires_at is not None:
+        headers["Upload-Expires"] = formatdate(expires_at, usegmt=True)
+    return Response(status_code=status_code, headers=headers)
+
+def upload_error(exc):
+    return Response(exc.detail, status_code=exc.status_code, headers=TUS_HEADERS, media_type="text/plain")
+
+@app.options("/uploads")
+async def upload_options():
+    return upload_response(204, **{
+        "Tus-Version": uploads.TUS_VERSION,
+        "Tus-Extension": "creation,expiration,checksum,termination",
+        "Tus-Checksum-Algorithm": "sha256",
+        "Tus-Max-Size": str(uploads.MAX_SIZE),
+    })
 
-@app.get("/admin")
-async def admin_page(request: Request):
-    user = request.session.get("user")
-    if not user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
+@app.post("/uploads")
+async def create_upload(request: Request):
+    try:
+        length = int(request.headers["Upload-Length"])
+        # Keyed like the rate limits, by the connecting address
+        client = request.client.host if request.client else None
+        upload_id = uploads.create(length, request.headers.get("Upload-Metadata"), client)
+        offset, _, expires_at, _ = uploads.status(upload_id)
+    except (KeyError, ValueError):
+        return upload_error(uploads.UploadError(400, "Missing or invalid Upload-Length"))
+    except uploads.UploadError as exc:
+        return upload_error(exc)
+    return upload_response(201, offset, expires_at, Location=f"/uploads/{upload_id}")
+
+@app.head("/uploads/{upload_id}")
+async def upload_offset(upload_id: str):
+    try:
+        offset, length, expires_at, _ = uploads.status(upload_id)
+    except uploads.UploadError as exc:
+        return upload_response(exc.status_code)
+    return upload_response(200, offset, expires_at, **{"Upload-Length": str(length), "Cache-Control": "no-store"})
+
+@app.patch("/uploads/{upload_id}")
+async def upload_chunk(request: Request, upload_id: str):
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        return upload_error(uploads.UploadError(415, "Content-Type must be application/offset+octet-stream"))
+    try:
+        offset = int(request.headers["Upload-Offset"])
+    except (KeyError, ValueError):
+        return upload_error(uploads.UploadError(400, "Missing or invalid Upload-Offset"))
+    try:
+        offset = await uploads.append(upload_id, offset, request.stream(), request.headers.get("Upload-Checksum"))
+        _, _, expires_at, _ = uploads.status(upload_id)
+    except uploads.UploadError as exc:
+        return upload_error(exc)
+    except ClientDisconnect:
+        # What arrived is kept; the client resumes from HEAD's offset
+        return upload_response(400)
+    return upload_response(204, offset, expires_at)
+
+@app.delete("/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    try:
+        uploads.status(upload_id)
+    except uploads.UploadError as exc:
+        return upload_error(exc)
+    uploads.terminate(upload_id)
+    return upload_response(204)
+
+# Submissions queue here instead of in SQLite's busy handler, whose
+# sleep-and-retry backoff let unlucky writers wait seconds under load
+submit_lock = asyncio.Lock()
+
+async def insert_application(staged, **values):
+    query = insert(PermitApplication).values(**values)
+    async with submit_lock, database.transaction():
+        application_id = await database.execute(query)
+        await stats.record_submission(values["permit_type"], values["other_permit_text"])
+        await previews.enqueue(staged.filenames)
+        # Last step before commit: a failed rename rolls the insert back
+        staged.promote()
+    return application_id
 
-    query = select(PermitApplication).order_by(PermitApplication.application_date.desc())
-    rows = await database.fetch_all(query)
+# ----- Admin View Applications -----
 
-    applications = []
-    for row in rows:
-        app_dict = dict(row)
-        if app_dict.get("supporting_files"):
-            try:
-                app_dict["supporting_files"] = json.loads(app_dict["supporting_files"])
-            except json.JSONDecodeError:
-                app_dict["supporting_files"] = []
-        else:
+def decode_application(row):
+    app_dict = dict(row)
+    raw_files = app_dict.get("supporting_files")
+    if raw_files:
+        try:
+            app_dict["supporting_files"] = json.loads(raw_files)
+        except json.JSONDecodeError:
             app_dict["supporting_files"] = []
-        applications.append(app_dict)
+    else:
+        app_dict["supporting_files"] = []
+    return app_dict
+
+async def iterate_applications(query):
+    async for row in database.iterate(query):
+        yield decode_application(row)
 
-    return templates.TemplateResponse("admin.html", {
+def parse_filter_date(value: Optional[str]):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+def filter_applications(query, permit_type: Optional[str] = None, date_from: Optional[str] = None,
+                        date_to: Optional[str] = None, search: Optional[str] = None,
+                        review_status: Optional[str] = None, model=PermitApplication):
+    parsed_from = parse_filter_date(date_from)
+    parsed_to = parse_filter_date(date_to)
+
+    if review_status:
+        if review_status not in review.STATUSES:
+            raise HTTPException(status_code=400, detail="Unknown status")
+        query = query.where(model.status == review_status)
+    if permit_type:
+        query = query.where(model.permit_type == permit_type)
+    if parsed_from:
+        query = query.where(model.application_date >= parsed_from)
+    if parsed_to:
+        query = query.where(model.application_date <= parsed_to)
+    if search:
+        pattern = search.replace("/", "//").replace("%", "/%").replace("_", "/_")
+        query = query.where(model.full_name.ilike(f"%{pattern}%", escape="/"))
+    return query
+
+@app.get("/admin")
+async def admin_page(
+    request: Request,
+    permit_type: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    search: Optional[str] = None,
+    review_status: Optional[str] = Query(None, alias="status"),
+    archived: bool = False,
+    user: dict = Depends(require_admin_roles)
+):
+    model = ArchivedPermitApplication if archived else PermitApplication
+    query = select(model).order_by(model.application_date.desc())
+    query = filter_applications(query, permit_type, date_from, date_to, search, review_status, model)
+
+    audit.record(user, "list", request, detail={
+        "permit_type": permit_type, "date_from": date_from, "date_to": date_to,
+        "search": search, "status": review_status, "archived": archived
+    })
+
+    return stream_template("admin.html", {
         "request": request,
         "user": user,
-        "applications": applications
+        "applications": iterate_applications(query),
+        "filters": {
+            "permit_type": permit_type or "",
+            "date_from": date_from or "",
+            "date_to": date_to or "",
+            "search": search or "",
+            "status": review_status or "",
+            "archived": archived
+        },
+        "statuses": review.STATUSES,
+        "actions": review.ACTIONS
     })
 
-@app.get("/admin/app/{application_id}")
-async def view_application(request: Request, application_id: int):
-    user = request.session.get("user")
-    if not user:
-        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
+# ----- Admin Review Actions -----
 
+MAX_BULK_DECISIONS = 5000
+
+@app.post("/admin/applications/bulk")
+async def bulk_review(request: Request, user: dict = Depends(require_admin_roles)):
+    # Accepts either the admin list form (application_ids + action) or JSON
+    # {"decisions": [{"id": 1, "action": "approve"}, ...]} for scripted triage.
+    if request.headers.get("content-type", "").startswith("application/json"):
+        payload = await request.json()
+        decisions = [(item.get("id"), item.get("action")) for item in payload.get("decisions", [])]
+        next_url = None
+    else:
+        form = await request.form()
+        action = form.get("action")
+        decisions = [(application_id, action) for application_id in form.getlist("application_ids")]
+        next_url = form.get("next") or "/admin"
+
+    if len(decisions) > MAX_BULK_DECISIONS:
+        raise HTTPException(status_code=400, detail="Too many decisions in one request")
+    try:
+        decisions = [(int(application_id), action) for application_id, action in decisions]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid application id")
+    if any(action not in review.ACTIONS for _, action in decisions):
+        raise HTTPException(status_code=400, detail="Unknown action")
+
+    updated = await review.apply_decisions(decisions, user["username"])
+
+    if next_url is None:
+        return {"updated": updated}
+    if not next_url.startswith("/admin"):
+        next_url = "/admin"
+    return RedirectResponse(url=next_url, status_code=status.HTTP_303_SEE_OTHER)
+
+# ----- Admin Export -----
+
+# submission_key can replay a submission's success page, so it stays internal
+EXPORT_COLUMNS = [
+    column.name for column in PermitApplication.__table__.columns
+    if column.name not in ("submission_key", "submission_fingerprint")
+]
+EXPORT_CHUNK_ROWS = 500
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def export_csv_chunks(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    pending = 0
+    async for row in database.iterate(query):
+        writer.writerow([export_value(row[column]) for column in EXPORT_COLUMNS])
+        pending += 1
+        if pending >= EXPORT_CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    yield buffer.getvalue()
+
+async def export_ndjson_chunks(query):
+    lines = []
+    async for row in database.iterate(query):
+        record = {column: export_value(row[column]) for column in EXPORT_COLUMNS}
+        try:
+            record["supporting_files"] = json.loads(record["supporting_files"] or "[]")
+        except json.JSONDecodeError:
+            record["supporting_files"] = []
+        lines.append(json.dumps(record))
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+@app.get("/admin/export")
+async def export_applications(
+    request: Request,
+    format: str = "csv",
+    permit_type: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    search: Optional[str] = None,
+    review_status: Optional[str] = Query(None, alias="status"),
+    archived: bool = False,
+    user: dict = Depends(require_admin_roles)
+):
+    if format == "csv":
+        chunks, media_type = export_csv_chunks, "text/csv"
+    elif format == "ndjson":
+        chunks, media_type = export_ndjson_chunks, "application/x-ndjson"
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+
+    model = ArchivedPermitApplication if archived else PermitApplication
+    query = select(model).order_by(model.id)
+    query = filter_applications(query, permit_type, date_from, date_to, search, review_status, model)
+
+    audit.record(user, "export", request, detail={
+        "format": format, "permit_type": permit_type, "date_from": date_from, "date_to": date_to,
+        "search": search, "status": review_status, "archived": archived
+    })
+
+    return StreamingResponse(chunks(query), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="permit_applications.{format}"'
+    })
+
+async def fetch_application(application_id: int):
     query = select(PermitApplication).where(PermitApplication.id == application_id)
     app_data = await database.fetch_one(query)
+    archived = False
 
     if not app_data:
-        raise HTTPException(status_code=404, detail="Application not found")
+        # Fall back to the archive so old links keep working
+        query = select(ArchivedPermitApplication).where(ArchivedPermitApplication.id == application_id)
+        app_data = await database.fetch_one(query)
+        archived = True
 
-    app_dict = dict(app_data)
-    raw_files = app_dict.get("supporting_files")
-    if raw_files:
-        try:
-            app_dict["supporting_files"] = json.loads(raw_files)
-        except json.JSONDecodeError:
-            app_dict["supporting_files"] = []
+    if not app_data:
+        return None
+
+    app_dict = decode_application(app_data)
+    app_dict["archived"] = archived
+    return app_dict
+
+@app.get("/admin/app/{application_id}")
+async def view_application(request: Request, application_id: int, user: dict = Depends(require_admin_roles)):
+    # The page depends only on the application and its previews, so the
+    # rendered HTML is shared by every admin; see detailcache.py
+    generation = detailcache.generation()
+    entry = detailcache.get(application_id)
+    if entry is None:
+        app_dict, generation = await detailcache.load(application_id, fetch_application)
+        if app_dict is None:
+            raise HTTPException(status_code=404, detail="Application not found")
     else:
-        app_dict["supporting_files"] = []
+        app_dict = entry[1]
+
+    available = previews.available(app_dict["supporting_files"])
+    if entry is not None and entry[2] == available:
+        detailcache.cache_stats["hits"] += 1
+        html = entry[3]
+    else:
+        if entry is not None:
+            detailcache.cache_stats["rerenders"] += 1
+        html = templates.get_template("admin_application_detail.html").render({
+            "request": request,
+            "app": app_dict,
+            "previews": available,
+            "actions": review.ACTIONS
+        })
+        detailcache.put(application_id, app_dict, available, html, generation)
+
+    audit.record(user, "view", request, application_id=application_id)
+    return HTMLResponse(html)
 
-    return templates.TemplateResponse("admin_application_detail.html", {
+# ----- Audit Log -----
+
+AUDIT_PAGE_SIZE = 50
+
+@app.get("/admin/audit", response_class=HTMLResponse)
+async def audit_log(
+    request: Request,
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+    application_id: Optional[int] = None,
+    before: Optional[int] = None,
+    user: dict = Depends(require_admin_roles)
+):
+    # Keyset pagination on id, newest first, so deep pages cost the same
+    query = select(AuditEvent).order_by(AuditEvent.id.desc()).limit(AUDIT_PAGE_SIZE + 1)
+    if actor:
+        query = query.where(AuditEvent.actor_id == actor)
+    if action:
+        query = query.where(AuditEvent.action == action)
+    if application_id is not None:
+        query = query.where(AuditEvent.application_id == application_id)
+    if before is not None:
+        query = query.where(AuditEvent.id < before)
+
+    rows = await database.fetch_all(query)
+    events = []
+    for row in rows[:AUDIT_PAGE_SIZE]:
+        event = dict(row)
+        event["at"] = datetime.fromtimestamp(event["at"], timezone.utc)
+        event["detail"] = json.loads(event["detail"]) if event["detail"] else {}
+        events.append(event)
+
+    return templates.TemplateResponse("admin_audit.html", {
+        "request": request,
+        "user": user,
+        "events": events,
+        "next_before": events[-1]["id"] if len(rows) > AUDIT_PAGE_SIZE else None,
+        "filters": {"actor": actor or "", "action": action or "", "application_id": application_id},
+        "pending": audit.metrics()["buffered"]
+    })
+
+# ----- Request Profiles -----
+
+PROFILE_SORTS = {"cumulative", "tottime", "calls"}
+
+@app.get("/admin/profiles", response_class=HTMLResponse)
+async def list_profiles(request: Request, user: dict = Depends(require_admin_roles)):
+    profiles = await asyncio.to_thread(profiling.listing)
+    for profile in profiles:
+        profile["at"] = datetime.fromtimestamp(profile["at"], timezone.utc)
+    return templates.TemplateResponse("admin_profiles.html", {
+        "request": request,
+        "user": user,
+        "profiles": profiles,
+        "keep": profiling.PROFILE_KEEP
+    })
+
+@app.get("/admin/profiles/{name}")
+async def profile_summary(name: str, sort: str = "cumulative", user: dict = Depends(require_admin_roles)):
+    if sort not in PROFILE_SORTS:
+        raise HTTPException(status_code=400, detail="Unknown sort order")
+    return PlainTextResponse(await asyncio.to_thread(profiling.summary, name, sort))
+
+@app.get("/admin/profiles/{name}/download")
+async def download_profile(name: str, user: dict = Depends(require_admin_roles)):
+    prof_path, _ = profiling.paths(name)
+    if not os.path.exists(prof_path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(prof_path, media_type="application/octet-stream", filename=f"{name}.prof")
+
+# ----- Applicant Portal -----
+
+MY_PAGE_SIZE = 20
+
+async def fetch_my_applications(model, discord_user_id, before, limit):
+    # Reads only ix_*_discord_user: seek to the user, walk ids downwards
+    query = select(*[model.__table__.c[name] for name in MY_APPLICATION_COLUMNS]) \
+        .where(model.discord_user_id == discord_user_id) \
+        .order_by(model.id.desc()).limit(limit)
+    if before is not None:
+        query = query.where(model.id < before)
+    return [{**dict(row), "archived": model is ArchivedPermitApplication} for row in await database.fetch_all(query)]
+
+@app.get("/my/applications", response_class=HTMLResponse)
+async def my_applications(request: Request, before: Optional[int] = None):
+    user = request.session.get("user")
+    if not user:
+        request.session["login_next"] = "/my/applications"
+        return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
+
+    # Archived rows keep their ids, so both tables page on the same key
+    rows = []
+    for model in (PermitApplication, ArchivedPermitApplication):
+        rows += await fetch_my_applications(model, str(user["id"]), before, MY_PAGE_SIZE + 1)
+    rows.sort(key=lambda row: row["id"], reverse=True)
+    applications = rows[:MY_PAGE_SIZE]
+
+    return templates.TemplateResponse("my_applications.html", {
         "request": request,
         "user": user,
-        "app": app_dict
+        "applications": applications,
+        "next_before": applications[-1]["id"] if len(rows) > MY_PAGE_SIZE else None,
+        "first_page": before is None
     })
 
 laws_data = [
@@ -1092,7 +1663,25 @@ async def permits(request: Request):
 
 @app.get("/permit")
 async def permit(request: Request):
-    return templates.TemplateResponse("permit.html", {"request": request})
+    # A fresh token per page load; resubmitting this copy of the form is a duplicate
+    user = request.session.get("user")
+    if not user:
+        # The form's "Log in with Discord" link brings the applicant back here
+        request.session["login_next"] = "/permit"
+    return templates.TemplateResponse("permit.html", {
+        "request": request,
+        "submission_token": idempotency.new_token(),
+        "user": user
+    })
+
+@app.get("/permit/token")
+async def permit_token(request: Request):
+    # For frozen copies of the permit form, which carry no token of their own
+    user = request.session.get("user")
+    return JSONResponse(
+        {"submission_token": idempotency.new_token(), "username": user["username"] if user else None},
+        headers={"Cache-Control": "no-store"}
+    )
 
 @app.get("/documents")
 async def documents(request: Request):
@@ -1120,7 +1709,7 @@ async def document_detail(request: Request, document_id: str):
     doc.setdefault("signatories", [])
     doc.setdefault("text", "No document text available.")
 
-    return templates.TemplateResponse("document_detail.html", {"request": request, "document": doc})
+    return stream_template("document_detail.html", {"request": request, "document": doc})
 
 @app.get("/laws/{law_id}")
 async def law_detail(request: Request, law_id: str):
@@ -1145,6 +1734,20 @@ async def login():
 async def health_check():
     return {"status": "ok"}
 
+# ----- Deployment Mode -----
+
+# Pages that only change on deploy; manage.py freeze renders these to files
+PUBLIC_PAGES = {home, laws, law_detail, permits, permit, documents, document_detail}
+
+if os.getenv("DRIFTSITE_DYNAMIC_ONLY"):
+    # The frozen pages and /static are served by nginx or a CDN, so this
+    # process only answers submissions, uploads, auth and admin routes
+    app.router.routes[:] = [
+        route for route in app.router.routes
+        if getattr(route, "endpoint", None) not in PUBLIC_PAGES and getattr(route, "name", None) != "static"
+    ]
+
+# Development server; use serve.py in production
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,143 @@
+import argparse
+import os
+
+def cmd_seed(args):
+    import seed
+    import stats
+    from database import engine_sync
+
+    count = seed.seed_database(args.rows, files_per_app=args.files, batch_size=args.batch_size, seed=args.seed)
+    print(f"Inserted {count} permit applications")
+    # Bulk inserts bypass the per-submission rollup updates
+    stats.rebuild(engine_sync)
+
+def cmd_rebuild_stats(args):
+    import stats
+    from database import engine_sync, init_db
+
+    init_db()
+    count = stats.rebuild(engine_sync)
+    print(f"Rebuilt {count} rollup rows")
+
+def cmd_reap(args):
+    import asyncio
+    import storage
+    from database import database
+
+    async def run():
+        await database.connect()
+        try:
+            return await storage.sweep()
+        finally:
+            await database.disconnect()
+
+    if args.grace is not None:
+        storage.REAPER_GRACE = args.grace
+    reclaimed = asyncio.run(run())
+    print(f"Reclaimed {reclaimed} bytes ({storage.reaper_stats['files_reaped']} files)")
+
+def cmd_archive(args):
+    import archive
+    from database import init_db
+
+    init_db()
+    if args.after_days is not None:
+        archive.ARCHIVE_AFTER_DAYS = args.after_days
+    moved = archive.run_archive()
+    print(f"Archived {moved} permit applications")
+
+def cmd_backup(args):
+    import backup
+
+    if args.list:
+        for path in backup.snapshots():
+            print(f"{path}  {os.path.getsize(path)} bytes")
+        return
+    path = backup.create_backup()
+    if path is None:
+        raise SystemExit("Another backup is in progress")
+    print(f"Wrote {path} ({backup.backup_stats['last_backup_bytes']} bytes in {backup.backup_stats['last_backup_seconds']}s)")
+
+def cmd_restore(args):
+    import backup
+
+    if args.snapshot == "latest":
+        available = backup.snapshots()
+        if not available:
+            raise SystemExit(f"No snapshots in {backup.BACKUP_DIR}")
+        path = available[0]
+    else:
+        path = args.snapshot
+    try:
+        if args.verify_only:
+            backup.verify(path)
+            print(f"{path} is intact")
+            return
+        backup.restore(path)
+    except (OSError, ValueError) as exc:
+        raise SystemExit(f"Not restored: {exc}")
+    print(f"Restored {backup.DATABASE_PATH} from {path}")
+
+def cmd_freeze(args):
+    # Rendering needs no database; don't create or migrate one
+    os.environ.setdefault("DRIFTSITE_SKIP_CREATE_ALL", "1")
+    os.environ.pop("DRIFTSITE_DYNAMIC_ONLY", None)
+    import freeze
+    import main
+
+    out_dir = args.out or freeze.FREEZE_DIR
+    if args.check:
+        problems = freeze.check(main, out_dir)
+        for problem in problems:
+            print(problem)
+        if problems:
+            raise SystemExit(f"{len(problems)} differences; run `manage.py freeze` again")
+        print(f"{out_dir} matches the live pages")
+        return
+    pages, assets = freeze.freeze(main, out_dir, args.site_url or freeze.SITE_URL)
+    print(f"Froze {pages} pages and {assets} assets into {out_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Corsair Council site management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="Fill the database with synthetic permit applications")
+    seed_parser.add_argument("rows", type=int, help="Number of applications to insert")
+    seed_parser.add_argument("--files", type=int, default=0, help="Maximum supporting files per application")
+    seed_parser.add_argument("--batch-size", type=int, default=1000)
+    seed_parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible data")
+    seed_parser.set_defaults(func=cmd_seed)
+
+    stats_parser = subparsers.add_parser("rebuild-stats", help="Recompute the admin dashboard rollups from scratch")
+    stats_parser.set_defaults(func=cmd_rebuild_stats)
+
+    reap_parser = subparsers.add_parser("reap", help="Delete uploads no application references")
+    reap_parser.add_argument("--grace", type=float, default=None,
+                             help="Only delete files older than this many seconds (default: REAPER_GRACE)")
+    reap_parser.set_defaults(func=cmd_reap)
+
+    archive_parser = subparsers.add_parser("archive", help="Move old and closed applications to the archive table")
+    archive_parser.add_argument("--after-days", type=int, default=None,
+                                help="Archive applications submitted more than this many days ago (default: ARCHIVE_AFTER_DAYS)")
+    archive_parser.set_defaults(func=cmd_archive)
+
+    backup_parser = subparsers.add_parser("backup", help="Take an online snapshot of the database")
+    backup_parser.add_argument("--list", action="store_true", help="List existing snapshots instead")
+    backup_parser.set_defaults(func=cmd_backup)
+
+    restore_parser = subparsers.add_parser("restore", help="Replace the database with a verified snapshot (stop the site first)")
+    restore_parser.add_argument("snapshot", help="Snapshot path, or 'latest'")
+    restore_parser.add_argument("--verify-only", action="store_true", help="Check the checksum and integrity without restoring")
+    restore_parser.set_defaults(func=cmd_restore)
+
+    freeze_parser = subparsers.add_parser("freeze", help="Render the public pages to static files for nginx or a CDN")
+    freeze_parser.add_argument("--out", default=None, help="Output directory (default: FREEZE_DIR or ./frozen)")
+    freeze_parser.add_argument("--site-url", default=None, help="Absolute URL prefix for the sitemap (default: SITE_URL)")
+    freeze_parser.add_argument("--check", action="store_true", help="Compare an existing freeze with the live pages instead")
+    freeze_parser.set_defaults(func=cmd_freeze)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
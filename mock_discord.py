@@ -0,0 +1,68 @@
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+# Minimal stand-in for the parts of the Discord API the site talks to,
+# used by bench.py to drive the OAuth flow without the network.
+
+MOCK_USER = {
+    "id": "100000000000000001",
+    "username": "mock_admin",
+    "discriminator": "0001",
+    "avatar": None,
+}
+
+def create_app(roles, webhook_bucket_size=5, webhook_reset_after=0.2):
+    mock = FastAPI()
+    # Messages posted to /webhooks/..., with a simplified version of
+    # Discord's per-webhook rate limit bucket
+    mock.state.webhook_messages = []
+    bucket = {"remaining": webhook_bucket_size, "reset_at": 0.0}
+
+    @mock.post("/oauth2/token")
+    async def token():
+        return {"access_token": "mock-access-token", "token_type": "Bearer", "expires_in": 604800}
+
+    @mock.get("/users/@me")
+    async def me(request: Request):
+        return MOCK_USER
+
+    @mock.get("/guilds/{guild_id}/members/{user_id}")
+    async def guild_member(guild_id: str, user_id: str):
+        return {"user": MOCK_USER, "roles": list(roles)}
+
+    @mock.post("/webhooks/{webhook_id}/{webhook_token}")
+    async def webhook(webhook_id: str, webhook_token: str, request: Request):
+        now = time.monotonic()
+        if now >= bucket["reset_at"]:
+            bucket["remaining"], bucket["reset_at"] = webhook_bucket_size, now + webhook_reset_after
+        if bucket["remaining"] <= 0:
+            retry_after = round(bucket["reset_at"] - now, 3)
+            return JSONResponse({"message": "You are being rate limited.", "retry_after": retry_after},
+                                status_code=429, headers={"Retry-After": str(retry_after)})
+        bucket["remaining"] -= 1
+        mock.state.webhook_messages.append(await request.json())
+        return Response(status_code=204, headers={
+            "X-RateLimit-Remaining": str(bucket["remaining"]),
+            "X-RateLimit-Reset-After": str(round(bucket["reset_at"] - now, 3)),
+        })
+
+    return mock
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def serve_in_thread(mock_app, port=None):
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(mock_app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import threading
+
+from mock_discord import free_port
+from serverstatus import pack_string, packet, read_packet, unpack_varint
+
+# Local stand-in for a Minecraft server that answers the Server List Ping
+# handshake, used by bench.py so the status sampler has something to talk to.
+
+STATUS = {
+    "version": {"name": "1.21.1", "protocol": 767},
+    "players": {"max": 40, "online": 3, "sample": [
+        {"name": "mock_miner", "id": "00000000-0000-0000-0000-000000000001"}
+    ]},
+    "description": {"text": "§aDrift of Stars §7(mock)", "extra": [{"text": " — testing"}]},
+}
+
+async def handle(reader, writer):
+    try:
+        packet_id, body = await read_packet(reader)
+        if packet_id != 0x00:
+            return
+        _protocol, offset = unpack_varint(body)
+        host_length, offset = unpack_varint(body, offset)
+        offset += host_length + 2  # host and port
+        next_state, _ = unpack_varint(body, offset)
+        if next_state != 1:
+            return
+
+        packet_id, _ = await read_packet(reader)
+        if packet_id == 0x00:
+            writer.write(packet(0x00, pack_string(json.dumps(STATUS))))
+            await writer.drain()
+            packet_id, body = await read_packet(reader)
+        if packet_id == 0x01:
+            writer.write(packet(0x01, body[:8]))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+def serve_in_thread(port=None):
+    # Returns (stop function, port)
+    port = port or free_port()
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", port))
+        started.set()
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+    return (lambda: loop.call_soon_threadsafe(loop.stop)), port
@@ -0,0 +1,273 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Posts new applications to a Discord channel webhook. publish() only
+# appends to memory; a background task coalesces bursts into as few
+# messages as Discord allows and honours its rate limits. When the buffer
+# is full, new notifications queue in an overflow list that another task
+# moves to a JSON-lines spool file off the event loop; they are sent once
+# the backlog drains. The spool is shared by every serve.py worker, is
+# only ever appended to, and is read from a saved offset, so draining it
+# costs as much as the lines taken. Past SPOOL_MAX_BYTES of unsent lines,
+# new notifications are dropped (the applications themselves are saved).
+
+DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
+SITE_URL = os.getenv("SITE_URL", "").rstrip("/")
+BUFFER_SIZE = int(os.getenv("NOTIFY_BUFFER_SIZE", "200"))
+COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "5"))
+SPOOL_PATH = os.getenv("NOTIFY_SPOOL_PATH", "notification_spool.jsonl")
+SPOOL_MAX_BYTES = int(os.getenv("NOTIFY_SPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+MESSAGE_LIMIT = 2000
+RETRY_DELAY_MAX = 300
+
+_buffer = deque()
+_overflow = deque()  # published while the buffer was full, not yet spooled
+_spooled = False  # this worker has left items in the spool
+_pending = None
+_overflowed = None
+_task = None
+_spill_task = None
+
+notify_stats = {"dropped": 0}
+
+# ----- Buffer and Spool -----
+
+@contextmanager
+def spool_lock():
+    # Every serve.py worker shares the spool. Appends and drains hold this,
+    # so two workers never take the same lines. Only taken off the event
+    # loop (and at shutdown).
+    with open(f"{SPOOL_PATH}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+def read_offset():
+    # Bytes of the spool already taken into some worker's buffer
+    try:
+        with open(f"{SPOOL_PATH}.offset") as f:
+            return int(f.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+def append_to_spool(items):
+    # Returns how many items did not fit under SPOOL_MAX_BYTES
+    dropped = 0
+    with spool_lock():
+        try:
+            unsent = os.path.getsize(SPOOL_PATH) - read_offset()
+        except FileNotFoundError:
+            unsent = 0
+        with open(SPOOL_PATH, "ab") as f:
+            for item in items:
+                line = (json.dumps(item) + "\n").encode()
+                if unsent + len(line) > SPOOL_MAX_BYTES:
+                    dropped += 1
+                    continue
+                f.write(line)
+                unsent += len(line)
+    return dropped
+
+def take_from_spool(room):
+    # Returns (up to room items, whether any are left)
+    with spool_lock():
+        if not os.path.exists(SPOOL_PATH):
+            return [], False
+        items = []
+        with open(SPOOL_PATH, "rb") as f:
+            f.seek(read_offset())
+            while len(items) < room and (line := f.readline()):
+                items.append(json.loads(line))
+            offset = f.tell()
+            left = offset < os.fstat(f.fileno()).st_size
+        if left:
+            tmp_path = f"{SPOOL_PATH}.offset.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(offset))
+            os.replace(tmp_path, f"{SPOOL_PATH}.offset")
+        else:
+            for path in (SPOOL_PATH, f"{SPOOL_PATH}.offset"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return items, left
+
+def publish(application):
+    # Memory only, so a submission never waits on the spool
+    if not DISCORD_WEBHOOK_URL:
+        return
+    if len(_buffer) >= BUFFER_SIZE or _overflow or _spooled:
+        # Keep ordering: once anything is spooled, new items queue behind it
+        _overflow.append(application)
+        if _overflowed is not None:
+            _overflowed.set()
+    else:
+        _buffer.append(application)
+    if _pending is not None:
+        _pending.set()
+
+async def refill_from_spool():
+    global _spooled
+    room = BUFFER_SIZE - len(_buffer)
+    if room <= 0:
+        return
+    items, _spooled = await asyncio.to_thread(take_from_spool, room)
+    _buffer.extend(items)
+
+def record_dropped(dropped):
+    if dropped:
+        notify_stats["dropped"] += dropped
+        logger.warning("Notification spool full; dropped %d notifications", dropped)
+
+async def _spill():
+    global _spooled
+    while True:
+        await _overflowed.wait()
+        _overflowed.clear()
+        if not _overflow:
+            continue
+        # Items leave the overflow only once written, so nothing looks sent
+        # while the write is in progress
+        count = len(_overflow)
+        _spooled = True
+        write = asyncio.ensure_future(asyncio.to_thread(append_to_spool, list(_overflow)[:count]))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # Shutting down: the write still completes, so wait for it rather
+            # than have stop() spool the same items again
+            await asyncio.wait([write])
+            raise
+        except Exception:
+            logger.exception("Failed to spool notifications")
+            continue
+        finally:
+            if write.done() and not write.exception():
+                record_dropped(write.result())
+                for _ in range(count):
+                    _overflow.popleft()
+
+def spill_buffer():
+    # On shutdown nothing is dropped (below the cap); the spool is sent
+    # after the next start
+    items = list(_buffer) + list(_overflow)
+    if items:
+        record_dropped(append_to_spool(items))
+    _buffer.clear()
+    _overflow.clear()
+
+# ----- Messages -----
+
+def format_line(application):
+    line = f"• **{application['full_name']}** — {application['permit_type']}"
+    if application.get("crew"):
+        line += f" ({application['crew']})"
+    if SITE_URL and application.get("id"):
+        line += f" <{SITE_URL}/admin/app/{application['id']}>"
+    return line
+
+def build_batch():
+    # As many buffered applications as fit in one message. Items stay in
+    # the buffer until the message is delivered.
+    header = "New permit applications:"
+    lines = []
+    length = len(header)
+    for application in _buffer:
+        line = format_line(application)[:MESSAGE_LIMIT - len(header) - 1]
+        if length + 1 + len(line) > MESSAGE_LIMIT:
+            break
+        lines.append(line)
+        length += 1 + len(line)
+    if len(lines) == 1:
+        header = "New permit application:"
+    return len(lines), "\n".join([header] + lines)
+
+def retry_after(response):
+    try:
+        return float(response.json().get("retry_after", 1))
+    except (ValueError, AttributeError):
+        return float(response.headers.get("Retry-After", 1))
+
+async def send(client, content):
+    # Returns only once Discord has accepted the message or rejected it for good
+    delay = 1
+    while True:
+        try:
+            response = await client.post(DISCORD_WEBHOOK_URL, json={
+                "content": content,
+                "allowed_mentions": {"parse": []}
+            })
+        except httpx.TransportError as exc:
+            logger.warning("Webhook delivery failed: %r", exc)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_DELAY_MAX)
+            continue
+
+        if response.status_code == 429:
+            await asyncio.sleep(retry_after(response))
+            continue
+        if response.status_code >= 500:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_DELAY_MAX)
+            continue
+        if response.status_code >= 400:
+            logger.error("Webhook rejected message: %s %s", response.status_code, response.text[:200])
+            return
+
+        # Wait out the bucket before the next message instead of hitting a 429
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            await asyncio.sleep(float(response.headers.get("X-RateLimit-Reset-After", 1)))
+        return
+
+async def _run():
+    async with httpx.AsyncClient(timeout=10) as client:
+        while True:
+            await refill_from_spool()
+            if not _buffer:
+                _pending.clear()
+                await _pending.wait()
+                # Let the rest of a burst arrive so it shares one message
+                await asyncio.sleep(COALESCE_SECONDS)
+                continue
+            count, content = build_batch()
+            await send(client, content)
+            for _ in range(count):
+                _buffer.popleft()
+
+def metrics():
+    return {
+        "enabled": bool(DISCORD_WEBHOOK_URL),
+        "buffered": len(_buffer),
+        "overflow": len(_overflow),
+        "spooled": os.path.exists(SPOOL_PATH),
+        **notify_stats,
+    }
+
+async def start():
+    global _pending, _overflowed, _task, _spill_task, _spooled
+    if not DISCORD_WEBHOOK_URL:
+        return
+    _pending = asyncio.Event()
+    _overflowed = asyncio.Event()
+    # Spilled by this or another worker before a restart
+    _spooled = os.path.exists(SPOOL_PATH)
+    _task = asyncio.create_task(_run())
+    _spill_task = asyncio.create_task(_spill())
+
+async def stop():
+    global _pending, _overflowed, _task, _spill_task
+    tasks = [task for task in (_task, _spill_task) if task is not None]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    spill_buffer()
+    _pending, _overflowed, _task, _spill_task = None, None, None, None
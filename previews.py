@@ -0,0 +1,99 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import jobs
+from storage import UPLOAD_DIR, logical_name, open_upload, stored_path
+PREVIEW_DIR = "permit_previews"
+PREVIEW_SIZE = (320, 320)
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tif", ".tiff"}
+PDF_EXTENSIONS = {".pdf"}
+
+_pool = None
+_backfill_task = None
+
+# ----- Rendering (runs in the worker processes) -----
+
+def preview_name(filename):
+    return f"{filename}.webp"
+
+def is_previewable(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return ext in IMAGE_EXTENSIONS or ext in PDF_EXTENSIONS
+
+def render_preview(src_path, dst_path):
+    from PIL import Image
+
+    # src_path may be a compressed upload (<name>.zst)
+    ext = os.path.splitext(logical_name(src_path))[1].lower()
+    with open_upload(src_path) as src:
+        if ext in PDF_EXTENSIONS:
+            import fitz  # PyMuPDF
+
+            with fitz.open(stream=src.read(), filetype="pdf") as doc:
+                pix = doc.load_page(0).get_pixmap(dpi=72)
+                image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        else:
+            image = Image.open(src)
+            image.seek(0)
+            image.load()
+
+    image.thumbnail(PREVIEW_SIZE)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    # Write next to the target and rename so a half-written preview is never served
+    tmp_path = f"{dst_path}.tmp"
+    image.save(tmp_path, "WEBP", quality=75)
+    os.replace(tmp_path, dst_path)
+    return dst_path
+
+# ----- Worker Pool -----
+
+def has_preview(filename):
+    return os.path.exists(os.path.join(PREVIEW_DIR, preview_name(filename)))
+
+def available(filenames):
+    return {f: preview_name(f) for f in filenames if has_preview(f)}
+
+async def enqueue(filenames):
+    # Queued through the job queue; at most one render job per file
+    for filename in filenames:
+        if is_previewable(filename) and not has_preview(filename):
+            await jobs.enqueue("render_preview", {"filename": filename}, key=f"preview:{filename}")
+
+@jobs.handler("render_preview")
+async def render_job(payload):
+    filename = payload["filename"]
+    if has_preview(filename):
+        return
+    src_path, _ = stored_path(filename) or (os.path.join(UPLOAD_DIR, filename), False)
+    await asyncio.get_running_loop().run_in_executor(
+        _pool,
+        render_preview,
+        src_path,
+        os.path.join(PREVIEW_DIR, preview_name(filename)),
+    )
+
+async def _backfill():
+    # Files uploaded before previews existed, or whose job was purged
+    for entry in os.scandir(UPLOAD_DIR):
+        if entry.is_file():
+            await enqueue([logical_name(entry.name)])
+
+async def start():
+    global _pool, _backfill_task
+    os.makedirs(PREVIEW_DIR, exist_ok=True)
+    _pool = ProcessPoolExecutor(max_workers=PREVIEW_WORKERS)
+    _backfill_task = asyncio.create_task(_backfill())
+
+async def stop():
+    global _pool, _backfill_task
+    if _backfill_task is not None:
+        _backfill_task.cancel()
+        await asyncio.gather(_backfill_task, return_exceptions=True)
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool, _backfill_task = None, None
@@ -0,0 +1,151 @@
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+# Per-request profiling for admins. A request carrying "X-Profile: 1" or
+# "?profile" from a session that passes the admin check runs under
+# cProfile from the first middleware it reaches until the last body chunk
+# is sent, so handler code, template rendering and the event loop work
+# around DB awaits are all included. Queries themselves run on aiosqlite's
+# thread and show up as time spent waiting. The result is written to
+# PROFILE_DIR as a pstats dump (open with snakeviz or python -m pstats)
+# plus a small JSON sidecar, and listed at /admin/profiles.
+#
+# Everything else goes straight through: the only cost for an ordinary
+# request is a substring check on its query string and header names.
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+SUMMARY_LINES = 40
+
+HEADER = b"x-profile"
+NAME_PATTERN = re.compile(r"^[0-9]{8}T[0-9]{6}-[a-z]+-[0-9a-z_-]*-[0-9a-f]{8}$")
+# A bare "?profile" counts as on
+FLAG_OFF = {"0", "false", "no", "off"}
+
+# Only one profiler can be attached to the event loop thread at a time, and
+# it sees every task the loop runs meanwhile; profiled requests take turns
+_lock = asyncio.Lock()
+
+def requested(scope):
+    query = scope.get("query_string", b"")
+    if b"profile" in query:
+        values = parse_qs(query.decode("latin-1"), keep_blank_values=True).get("profile")
+        if values and values[-1].lower() not in FLAG_OFF:
+            return True
+    for name, value in scope.get("headers", ()):
+        if name == HEADER:
+            return value.decode("latin-1").strip().lower() not in FLAG_OFF
+    return False
+
+def profile_name(scope):
+    slug = re.sub(r"[^0-9a-z]+", "_", scope["path"].lower()).strip("_")[:60]
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{scope['method'].lower()}-{slug}-{uuid.uuid4().hex[:8]}"
+
+def paths(name):
+    if not NAME_PATTERN.match(name):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    base = os.path.join(PROFILE_DIR, name)
+    return base + ".prof", base + ".json"
+
+def save(name, profiler, info):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    prof_path, info_path = paths(name)
+    profiler.dump_stats(prof_path)
+    with open(info_path, "w") as f:
+        json.dump(info, f)
+    rotate()
+
+def rotate(keep=PROFILE_KEEP):
+    # Names start with the UTC time, so sorting them sorts by age
+    names = sorted(entry[:-len(".json")] for entry in os.listdir(PROFILE_DIR) if entry.endswith(".json"))
+    for name in names[:-keep] if keep else names:
+        for path in paths(name):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def listing():
+    # Newest first
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not entry.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, entry)) as f:
+                info = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        info["name"] = entry[:-len(".json")]
+        profiles.append(info)
+    return profiles
+
+def summary(name, sort="cumulative"):
+    prof_path, _ = paths(name)
+    if not os.path.exists(prof_path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    out = io.StringIO()
+    stats = pstats.Stats(prof_path, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(SUMMARY_LINES)
+    return out.getvalue()
+
+class ProfilingMiddleware:
+    def __init__(self, app, authorize):
+        # authorize(request) raises HTTPException for non-admins
+        self.app = app
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not requested(scope):
+            await self.app(scope, receive, send)
+            return
+        try:
+            user = self.authorize(Request(scope))
+        except HTTPException:
+            # Not an admin: serve the request as if the flag were absent
+            await self.app(scope, receive, send)
+            return
+
+        name = profile_name(scope)
+        response_status = None
+
+        async def send_with_header(message):
+            nonlocal response_status
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile", f"/admin/profiles/{name}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        async with _lock:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_header)
+            finally:
+                profiler.disable()
+                wall_ms = (time.perf_counter() - started) * 1000
+                await asyncio.to_thread(save, name, profiler, {
+                    "at": time.time(),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": response_status,
+                    "wall_ms": round(wall_ms, 3),
+                    "user": user.get("username"),
+                })
@@ -0,0 +1,163 @@
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.responses import JSONResponse
+
+# Token buckets are checked by a plain ASGI middleware, before the route
+# (and therefore the multipart parser) ever sees the request body.
+
+SUBMIT_RATE_PER_MINUTE = float(os.getenv("SUBMIT_RATE_PER_MINUTE", "6"))
+SUBMIT_BURST = int(os.getenv("SUBMIT_BURST", "3"))
+AUTH_RATE_PER_MINUTE = float(os.getenv("AUTH_RATE_PER_MINUTE", "20"))
+AUTH_BURST = int(os.getenv("AUTH_BURST", "10"))
+UPLOAD_CREATE_RATE_PER_MINUTE = float(os.getenv("UPLOAD_CREATE_RATE_PER_MINUTE", "30"))
+UPLOAD_CREATE_BURST = int(os.getenv("UPLOAD_CREATE_BURST", "20"))
+
+# Shared SQLite file for bucket state when running several workers
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")
+MAX_TRACKED_KEYS = 10000
+
+# Concurrent requests allowed per route class. Submissions and public pages
+# are shed with a 503 once full; admin requests queue for their own pool,
+# so a flood of anonymous posts cannot starve staff.
+CONCURRENCY_LIMITS = {
+    "admin": int(os.getenv("CONCURRENCY_ADMIN", "16")),
+    "submit": int(os.getenv("CONCURRENCY_SUBMIT", "8")),
+    # Resumable upload chunks are long-lived body streams
+    "upload": int(os.getenv("CONCURRENCY_UPLOAD", "16")),
+    "public": int(os.getenv("CONCURRENCY_PUBLIC", "64")),
+}
+SHED_RETRY_AFTER = 1
+
+RATE_LIMITS = {
+    # (method, path): (bucket name, tokens per second, burst)
+    ("POST", "/submit-permit"): ("submit", SUBMIT_RATE_PER_MINUTE / 60, SUBMIT_BURST),
+    ("GET", "/auth/discord/callback"): ("auth", AUTH_RATE_PER_MINUTE / 60, AUTH_BURST),
+    ("POST", "/uploads"): ("upload", UPLOAD_CREATE_RATE_PER_MINUTE / 60, UPLOAD_CREATE_BURST),
+}
+
+UNLIMITED_PREFIXES = ("/static/", "/uploaded_permit_files/", "/permit_previews/", "/health")
+
+def route_class(path):
+    if path.startswith(UNLIMITED_PREFIXES):
+        return None
+    if path == "/admin" or path.startswith("/admin/"):
+        return "admin"
+    if path == "/submit-permit" or path.startswith("/auth/"):
+        return "submit"
+    if path == "/uploads" or path.startswith("/uploads/"):
+        return "upload"
+    return "public"
+
+def refill(tokens, updated, now, rate, burst):
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+# ----- Bucket Stores -----
+
+class MemoryBucketStore:
+    def __init__(self, max_keys=MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    async def take(self, key, rate, burst):
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (burst, now))
+        tokens, retry_after = refill(tokens, updated, now, rate, burst)
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+class SQLiteBucketStore:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self.calls = 0
+
+    def _take(self, key, rate, burst):
+        # Wall-clock time, since the state is shared between processes
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (burst, now)
+                tokens, retry_after = refill(tokens, updated, now, rate, burst)
+                self.conn.execute(
+                    "INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now)
+                )
+                self.calls += 1
+                if self.calls % 1000 == 0:
+                    self.conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - 3600,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return retry_after
+
+    async def take(self, key, rate, burst):
+        return await asyncio.to_thread(self._take, key, rate, burst)
+
+# ----- Middleware -----
+
+def reject(status_code, retry_after, detail):
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status_code,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+class AdmissionControlMiddleware:
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = store or (SQLiteBucketStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBucketStore())
+        self.semaphores = {name: asyncio.Semaphore(limit) for name, limit in CONCURRENCY_LIMITS.items()}
+
+    def bucket_keys(self, scope, bucket):
+        client = scope.get("client")
+        keys = [f"{bucket}:ip:{client[0] if client else 'unknown'}"]
+        user = scope.get("session", {}).get("user")
+        if user:
+            keys.append(f"{bucket}:user:{user['id']}")
+        return keys
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = RATE_LIMITS.get((scope["method"], scope["path"]))
+        if limit:
+            bucket, rate, burst = limit
+            for key in self.bucket_keys(scope, bucket):
+                retry_after = await self.store.take(key, rate, burst)
+                if retry_after:
+                    await reject(429, retry_after, "Too many requests")(scope, receive, send)
+                    return
+
+        route = route_class(scope["path"])
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        semaphore = self.semaphores[route]
+        if route != "admin" and semaphore.locked():
+            await reject(503, SHED_RETRY_AFTER, "Server busy")(scope, receive, send)
+            return
+
+        async with semaphore:
+            await self.app(scope, receive, send)
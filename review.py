@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects import sqlite
+
+import detailcache
+from database import database, PermitApplication
+
+STATUSES = ["pending", "in_review", "approved", "rejected"]
+CLOSED_STATUSES = ["approved", "rejected"]
+
+# action: (new status, keep reviewer, set decision time)
+ACTIONS = {
+    "assign": ("in_review", True, False),
+    "approve": ("approved", True, True),
+    "reject": ("rejected", True, True),
+    "reset": ("pending", False, False),
+}
+
+_update_query = (
+    update(PermitApplication)
+    .where(PermitApplication.id == bindparam("application_id"))
+    .values(status=bindparam("new_status"), reviewer=bindparam("new_reviewer"), decided_at=bindparam("new_decided_at"))
+)
+# databases has no real executemany for SQLite, so the statement is compiled
+# once and run through the driver's executemany.
+UPDATE_SQL = str(_update_query.compile(dialect=sqlite.dialect(paramstyle="named")))
+
+def decision_params(application_id, action, reviewer, now):
+    new_status, keep_reviewer, decided = ACTIONS[action]
+    return {
+        "application_id": application_id,
+        "new_status": new_status,
+        "new_reviewer": reviewer if keep_reviewer else None,
+        "new_decided_at": now if decided else None,
+    }
+
+async def apply_decisions(decisions, reviewer):
+    # decisions: iterable of (application_id, action), applied in one transaction
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+    params = [decision_params(application_id, action, reviewer, now) for application_id, action in decisions]
+    if not params:
+        return 0
+
+    async with database.connection() as connection:
+        async with connection.transaction():
+            cursor = await connection.raw_connection.executemany(UPDATE_SQL, params)
+            # Summed over every parameter set; ids that are missing or
+            # archived match no row and add nothing
+            updated = cursor.rowcount
+    detailcache.invalidate(param["application_id"] for param in params)
+    return updated
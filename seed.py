@@ -0,0 +1,100 @@
+import io
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from database import engine_sync, init_db, PermitApplication
+from storage import UPLOAD_DIR
+
+PERMIT_TYPES = [
+    "Letter of Marque", "Plunder License", "Magic Usage Permit", "Hat Registration Certificate",
+    "Trade Permit", "Explosive Handling Permit", "Ship Registration and Classification",
+    "Crew Manifest Approval", "Navigation License", "Diplomatic Envoy Pass",
+    "Contract Binding Seal Permit", "Smuggling Exemption Certificate", "Repair and Docking Permit",
+    "Harbor Trade License", "Salvage Operation Permit", "Monster Control Permit",
+    "Magical Artifact License", "Communications License", "Duel Authorization Certificate",
+    "Waste Disposal Permit", "Fog Navigation Exemption", "Currency Exchange License",
+    "Petition Filing Permit", "Embassy Establishment Permit", "Parade and Ceremony Permit",
+    "Hat Dyeing and Modification License", "Unauthorized Singing Permit", "Parrot Ownership Permit",
+    "Other",
+]
+CONTACT_METHODS = ["Owl Post", "Magical Message", "Carrier Parrot", "Smoke Signals", "Discord", "Other"]
+FIRST_NAMES = ["Anne", "Bartholomew", "Calico", "Davy", "Edward", "Grace", "Henry", "Jack", "Mary", "Ching"]
+LAST_NAMES = ["Bonny", "Roberts", "Rackham", "Jones", "Teach", "O'Malley", "Morgan", "Sparrow", "Read", "Shih"]
+EPITHETS = ["the Bold", "Blackbeard", "Saltwhisker", "of the Fog", "Three-Hats", "the Unregistered"]
+CREWS = ["The Gilded Gull", "Stormwake", "The Drowned Ledger", "Crimson Tide", "Silver Moon"]
+PORTS = ["Port Aurospan", "Tortuga Reach", "Fogwater Docks", "The Star Harbor"]
+WORDS = (
+    "hereby petition council hat registered vessel harbor cargo parrot license treaty "
+    "marque enemy flag ship voyage sea storm duty tariff crew captain seal lawful"
+).split()
+# Snowflake-shaped Discord ids; most applicants log in before applying
+DISCORD_USER_BASE = 100000000000000000
+DISCORD_USERS = 200000
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def write_upload(rng, upload_dir):
+    # A mix of compressible petitions and small scanned "maps"
+    if rng.random() < 0.5:
+        name = f"{uuid.uuid4().hex}_petition.txt"
+        data = "\n".join(sentence(rng, 16) for _ in range(rng.randint(5, 60))).encode()
+    else:
+        from PIL import Image
+
+        name = f"{uuid.uuid4().hex}_map.png"
+        image = Image.new("RGB", (rng.randint(200, 1200), rng.randint(200, 900)), (
+            rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        data = buffer.getvalue()
+
+    with open(os.path.join(upload_dir, name), "wb") as f:
+        f.write(data)
+    return name
+
+def generate_application(rng, files_per_app=0, upload_dir=UPLOAD_DIR, now=None):
+    now = now or datetime.now()
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    permit_type = rng.choice(PERMIT_TYPES)
+    preferred_contact = rng.choice(CONTACT_METHODS)
+    files = [write_upload(rng, upload_dir) for _ in range(rng.randint(0, files_per_app))]
+
+    return {
+        "full_name": f"{first} {last}",
+        "alias": f"{first} {rng.choice(EPITHETS)}" if rng.random() < 0.6 else None,
+        "crew": rng.choice(CREWS) if rng.random() < 0.7 else None,
+        "contact_address": f"{rng.choice(PORTS)}, berth {rng.randint(1, 99)}",
+        "preferred_contact": preferred_contact,
+        "other_corr_text": "Message in a bottle" if preferred_contact == "Other" else None,
+        "permit_type": permit_type,
+        "other_permit_text": sentence(rng, 4) if permit_type == "Other" else None,
+        "permit_details": " ".join(sentence(rng) for _ in range(rng.randint(1, 8))),
+        "supporting_files": json.dumps(files) if files else None,
+        "applicant_signature": f"{first} {last}",
+        "application_date": now - timedelta(days=rng.randint(0, 730), minutes=rng.randint(0, 1440)),
+        "discord_user_id": str(DISCORD_USER_BASE + rng.randint(1, DISCORD_USERS)) if rng.random() < 0.7 else None,
+    }
+
+def seed_database(rows, files_per_app=0, batch_size=1000, upload_dir=UPLOAD_DIR, seed=None, engine=engine_sync):
+    rng = random.Random(seed)
+    now = datetime.now()
+    if files_per_app:
+        os.makedirs(upload_dir, exist_ok=True)
+    init_db(engine)
+
+    inserted = 0
+    with engine.begin() as conn:
+        while inserted < rows:
+            batch = [
+                generate_application(rng, files_per_app, upload_dir, now)
+                for _ in range(min(batch_size, rows - inserted))
+            ]
+            conn.execute(insert(PermitApplication), batch)
+            inserted += len(batch)
+    return inserted
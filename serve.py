@@ -0,0 +1,79 @@
+import argparse
+import os
+
+import uvicorn
+
+# Production entry point. `python main.py` stays the development server
+# (single process, auto-reload); this launcher runs several workers on
+# uvloop + httptools and creates the tables once before they fork.
+#
+# State and multiple workers:
+#   - Sessions live in signed cookies, so they work across workers as long
+#     as every worker gets the same SESSION_SECRET_KEY. Set it explicitly;
+#     the built-in fallback key is only fit for development.
+#   - Rate limit buckets are in process memory by default, which gives each
+#     worker its own budget. Set RATE_LIMIT_DB to a shared SQLite file so
+#     the limits apply across workers.
+#   - Concurrency caps (CONCURRENCY_*) are per worker; the effective cap is
+#     the configured value times the worker count.
+#   - Every worker starts its own preview process pool (PREVIEW_WORKERS
+#     processes each) and backfill scan. Rendering the same file twice is
+#     harmless because previews are written atomically.
+#   - Every worker pings the Minecraft server on its own schedule and keeps
+#     its own 24 hour history, so the dashboard may show slightly different
+#     samples depending on which worker answers.
+#   - Dashboard rollups and applications are in SQLite and already shared.
+#   - Each worker schedules database backups, but a lock file in BACKUP_DIR
+#     lets only one of them take a snapshot at a time. backup_stats in
+#     /admin/metrics only reflects snapshots taken by the answering worker.
+#   - Each worker buffers Discord notifications in its own memory and posts
+#     them on its own schedule, so webhook rate limits are tracked per
+#     worker. Overflow goes to the one NOTIFY_SPOOL_PATH file, which an
+#     flock on NOTIFY_SPOOL_PATH.lock shares safely; whichever worker has
+#     room drains it. NOTIFY_SPOOL_MAX_BYTES caps it for all workers.
+#   - The application detail page cache is per worker. A review decision
+#     only clears it in the worker that handled it; other workers may show
+#     the old status for up to DETAIL_CACHE_TTL seconds.
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Corsair Council site in production")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE_TIMEOUT", "15")),
+                        help="Seconds to hold idle keep-alive connections open")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds to let in-flight requests finish on shutdown")
+    parser.add_argument("--access-log", action="store_true", help="Log every request (off by default for throughput)")
+    parser.add_argument("--dynamic-only", action="store_true", default=bool(os.getenv("DRIFTSITE_DYNAMIC_ONLY")),
+                        help="Skip the public pages and /static; serve them from `manage.py freeze` output instead")
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+                        help="Proxies trusted to set X-Forwarded-For (used for per-IP rate limits)")
+    args = parser.parse_args()
+
+    if args.dynamic_only:
+        # Read by main.py in every worker
+        os.environ["DRIFTSITE_DYNAMIC_ONLY"] = "1"
+
+    from database import init_db
+
+    init_db()
+    # Inherited by the worker processes, which then skip init_db on import
+    os.environ["DRIFTSITE_SKIP_CREATE_ALL"] = "1"
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop",
+        http="httptools",
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        access_log=args.access_log,
+    )
+
+if __name__ == "__main__":
+    main()
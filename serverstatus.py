@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import struct
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# Polls the Minecraft server with the Server List Ping protocol and keeps
+# the last 24 hours of samples in fixed-size arrays, so memory use does not
+# grow with uptime and the history endpoint never touches the database.
+# https://minecraft.wiki/w/Java_Edition_protocol/Server_List_Ping
+
+SAMPLE_INTERVAL = float(os.getenv("SERVER_SAMPLE_INTERVAL", "60"))
+HISTORY_SECONDS = 24 * 3600
+PING_TIMEOUT = float(os.getenv("SERVER_PING_TIMEOUT", "3"))
+# Any protocol version gets a status response; -1 is what clients send
+# when they only want to probe
+PROTOCOL_VERSION = -1
+MAX_RESPONSE = 256 * 1024
+
+FORMATTING_CODE = re.compile("§.")
+
+_task = None
+_target = None
+latest = {"online": False, "checked_at": None}
+
+# ----- Protocol -----
+
+def pack_varint(value):
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def pack_string(value):
+    data = value.encode("utf-8")
+    return pack_varint(len(data)) + data
+
+def packet(packet_id, payload=b""):
+    body = pack_varint(packet_id) + payload
+    return pack_varint(len(body)) + body
+
+def unpack_varint(data, offset=0):
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return (value - (1 << 32) if value & (1 << 31) else value), offset
+    raise ValueError("VarInt is too long")
+
+async def read_packet(reader):
+    # Returns (packet id, payload)
+    length = 0
+    for shift in range(0, 35, 7):
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+    else:
+        raise ValueError("VarInt is too long")
+    if length <= 0 or length > MAX_RESPONSE:
+        raise ValueError(f"Bad packet length {length}")
+    data = await reader.readexactly(length)
+    packet_id, offset = unpack_varint(data)
+    return packet_id, data[offset:]
+
+def plain_text(component):
+    # The MOTD is either a string or a chat component tree
+    if isinstance(component, str):
+        return FORMATTING_CODE.sub("", component)
+    if isinstance(component, list):
+        return "".join(plain_text(part) for part in component)
+    if isinstance(component, dict):
+        return plain_text(component.get("text", "")) + plain_text(component.get("extra", []))
+    return ""
+
+async def ping(host, port, timeout=PING_TIMEOUT):
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            handshake = pack_varint(PROTOCOL_VERSION) + pack_string(host) + struct.pack(">H", port) + pack_varint(1)
+            writer.write(packet(0x00, handshake) + packet(0x00))
+            await writer.drain()
+            packet_id, body = await read_packet(reader)
+            if packet_id != 0x00:
+                raise ValueError(f"Unexpected status packet id {packet_id}")
+            length, offset = unpack_varint(body)
+            status = json.loads(body[offset:offset + length])
+
+            # Latency is the ping/pong round trip, not the status exchange
+            token = time.monotonic_ns() & 0x7FFFFFFFFFFFFFFF
+            started = time.perf_counter()
+            writer.write(packet(0x01, struct.pack(">q", token)))
+            await writer.drain()
+            packet_id, body = await read_packet(reader)
+            latency_ms = (time.perf_counter() - started) * 1000
+            if packet_id != 0x01 or body[:8] != struct.pack(">q", token):
+                raise ValueError("Bad pong")
+        finally:
+            writer.close()
+
+        players = status.get("players") or {}
+        return {
+            "online": True,
+            "players_online": int(players.get("online", 0)),
+            "players_max": int(players.get("max", 0)),
+            "player_sample": [p.get("name", "") for p in players.get("sample") or []][:12],
+            "motd": plain_text(status.get("description", "")).strip(),
+            "version": (status.get("version") or {}).get("name", ""),
+            "latency_ms": round(latency_ms, 1),
+        }
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+# ----- History -----
+
+class History:
+    # Ring buffer over parallel typed arrays; NaN latency marks an offline sample
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.players = array("H", bytes(2 * capacity))
+        self.latency = array("f", bytes(4 * capacity))
+        self.head = 0  # next slot to write
+        self.count = 0
+
+    def append(self, when, online, players, latency_ms):
+        i = self.head
+        self.times[i] = when
+        self.players[i] = min(players, 0xFFFF) if online else 0
+        self.latency[i] = latency_ms if online else math.nan
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def samples(self, since=0.0):
+        # Oldest first
+        start = (self.head - self.count) % self.capacity
+        for n in range(self.count):
+            i = (start + n) % self.capacity
+            if self.times[i] >= since:
+                yield self.times[i], self.players[i], self.latency[i]
+
+    def downsample(self, seconds, points):
+        now = time.time()
+        since = now - seconds
+        width = seconds / points
+        buckets = [[0, 0, 0, 0.0] for _ in range(points)]  # samples, online, max players, latency sum
+        for when, players, latency in self.samples(since):
+            bucket = buckets[min(int((when - since) / width), points - 1)]
+            bucket[0] += 1
+            if not math.isnan(latency):
+                bucket[1] += 1
+                bucket[2] = max(bucket[2], players)
+                bucket[3] += latency
+
+        series = []
+        for n, (samples, online, players, latency_sum) in enumerate(buckets):
+            if not samples:
+                continue
+            series.append({
+                "t": round(since + (n + 0.5) * width),
+                "uptime": round(online / samples, 3),
+                "players": players,
+                "latency_ms": round(latency_sum / online, 1) if online else None,
+            })
+        return series
+
+history = History(int(HISTORY_SECONDS / SAMPLE_INTERVAL))
+
+# ----- Sampler -----
+
+async def sample():
+    global latest
+    host, port = _target
+    try:
+        result = await ping(host, port)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError) as exc:
+        logger.debug("Server ping failed: %r", exc)
+        result = {"online": False}
+    result["checked_at"] = time.time()
+    history.append(result["checked_at"], result["online"], result.get("players_online", 0), result.get("latency_ms", 0.0))
+    latest = result
+    return result
+
+async def _sampler():
+    while True:
+        try:
+            await sample()
+        except Exception:
+            logger.exception("Server status sample failed")
+        await asyncio.sleep(SAMPLE_INTERVAL)
+
+async def start(host, port):
+    global _task, _target
+    _target = (host, port)
+    _task = asyncio.create_task(_sampler())
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+    _task = None
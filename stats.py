@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, insert, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import database, ArchivedPermitApplication, PermitApplication, PermitStat
+
+DASHBOARD_DAYS = 30
+DASHBOARD_OTHER_TEXTS = 20
+
+def other_text_key(permit_type, other_permit_text):
+    if permit_type != "Other" or not other_permit_text:
+        return None
+    return other_permit_text.strip(" ") or None
+
+def rollup_keys(permit_type, other_permit_text, submitted_at=None):
+    # submitted_at defaults to CURRENT_TIMESTAMP, which SQLite records in UTC
+    submitted_at = submitted_at or datetime.now(timezone.utc)
+    keys = [
+        ("total", "all"),
+        ("permit_type", permit_type),
+        ("day", submitted_at.date().isoformat()),
+    ]
+    other_text = other_text_key(permit_type, other_permit_text)
+    if other_text:
+        keys.append(("other_permit_text", other_text))
+    return keys
+
+def increment_query(dimension, key):
+    query = sqlite_insert(PermitStat).values(dimension=dimension, key=key, count=1)
+    return query.on_conflict_do_update(
+        index_elements=[PermitStat.dimension, PermitStat.key],
+        set_={"count": PermitStat.count + 1}
+    )
+
+async def record_submission(permit_type, other_permit_text):
+    # Callers run this inside the same transaction as the application insert
+    for dimension, key in rollup_keys(permit_type, other_permit_text):
+        await database.execute(increment_query(dimension, key))
+
+def other_texts_query(limit=DASHBOARD_OTHER_TEXTS):
+    # Free text grows with every distinct answer; ix_permit_stats_dimension_count
+    # lets SQLite read just the top rows instead of the whole dimension
+    return (
+        select(PermitStat.key, PermitStat.count)
+        .where(PermitStat.dimension == "other_permit_text")
+        .order_by(PermitStat.count.desc())
+        .limit(limit)
+    )
+
+async def load_dashboard():
+    # total and permit_type have a handful of keys each
+    rows = await database.fetch_all(
+        select(PermitStat).where(PermitStat.dimension.in_(["total", "permit_type"]))
+    )
+    day_rows = await database.fetch_all(
+        select(PermitStat)
+        .where(PermitStat.dimension == "day")
+        .order_by(PermitStat.key.desc())
+        .limit(DASHBOARD_DAYS)
+    )
+    other_rows = await database.fetch_all(other_texts_query())
+
+    by_dimension = {"total": [], "permit_type": []}
+    for row in rows:
+        by_dimension[row["dimension"]].append((row["key"], row["count"]))
+
+    return {
+        "total": by_dimension["total"][0][1] if by_dimension["total"] else 0,
+        "by_permit_type": sorted(by_dimension["permit_type"], key=lambda item: -item[1]),
+        "by_day": [(row["key"], row["count"]) for row in day_rows],
+        "other_permit_texts": [(row["key"], row["count"]) for row in other_rows],
+    }
+
+# ----- Rebuild -----
+
+def rebuild(engine):
+    # Rollups count every application ever received, and archive.py moves
+    # rows out of the live table without touching them, so count both
+    columns = ("permit_type", "other_permit_text", "submitted_at")
+    applications = union_all(*(
+        select(*(model.__table__.c[name] for name in columns))
+        for model in (PermitApplication, ArchivedPermitApplication)
+    )).subquery()
+    other_text = func.trim(applications.c.other_permit_text)
+    sources = [
+        select(literal("total"), literal("all"), func.count())
+        .select_from(applications),
+        select(literal("permit_type"), applications.c.permit_type, func.count())
+        .group_by(applications.c.permit_type),
+        select(literal("day"), func.date(applications.c.submitted_at), func.count())
+        .group_by(func.date(applications.c.submitted_at)),
+        select(literal("other_permit_text"), other_text, func.count())
+        .where(applications.c.permit_type == "Other", other_text != "")
+        .group_by(other_text),
+    ]
+
+    with engine.begin() as conn:
+        conn.execute(delete(PermitStat))
+        for source in sources:
+            conn.execute(insert(PermitStat).from_select(["dimension", "key", "count"], source))
+        return conn.execute(select(func.count()).select_from(PermitStat)).scalar()
@@ -0,0 +1,297 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import zstandard
+from sqlalchemy import select
+
+from database import database, ArchivedPermitApplication, PermitApplication
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = "uploaded_permit_files"
+# Must be on the same filesystem as UPLOAD_DIR so promotion is an atomic rename
+STAGING_DIR = "upload_staging"
+CHUNK_SIZE = 1024 * 1024
+
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "3600"))
+REAPER_BATCH = int(os.getenv("REAPER_BATCH", "500"))
+# Files younger than this are never reaped, which covers submissions that
+# have promoted their files but not yet committed the row
+REAPER_GRACE = float(os.getenv("REAPER_GRACE", "3600"))
+
+# Compressible uploads are stored as <name>.zst; the name recorded on the
+# application stays <name>. See "Compressed Storage" below.
+COMPRESSED_SUFFIX = ".zst"
+# Compression runs before the submission commits; on scans and petitions
+# level 3 stores within about 1% of level 9 at three times the speed
+COMPRESS_LEVEL = int(os.getenv("UPLOAD_COMPRESS_LEVEL", "3"))
+COMPRESS_WORKERS = int(os.getenv("UPLOAD_COMPRESS_WORKERS", "2"))
+COMPRESS_MIN_SIZE = 4096
+COMPRESS_SAMPLE = 256 * 1024
+# Keep the compressed copy only if it is at most this fraction of the original
+COMPRESS_MAX_RATIO = 0.9
+
+reaper_stats = {
+    "files_reaped": 0,
+    "bytes_reclaimed": 0,
+    "last_sweep_at": None,
+    "last_sweep_seconds": None,
+}
+
+compression_stats = {
+    "files_compressed": 0,
+    "files_stored_raw": 0,
+    "bytes_in": 0,
+    "bytes_stored": 0,
+}
+
+_reaper_task = None
+_compress_pool = None
+
+# ----- Staged Uploads -----
+
+class StagedUploads:
+    # Files are written to STAGING_DIR and only renamed into UPLOAD_DIR once
+    # the application row is about to commit. discard() removes everything
+    # this submission wrote, promoted or not.
+
+    def __init__(self):
+        self.files = []  # (staged path, final filename)
+        self.promoted = []
+
+    @property
+    def filenames(self):
+        return [name for _, name in self.files]
+
+    async def add(self, upload):
+        safe_filename = os.path.basename(upload.filename)
+        unique_filename = f"{uuid.uuid4().hex}_{safe_filename}"
+        staged_path = os.path.join(STAGING_DIR, unique_filename)
+        self.files.append((staged_path, unique_filename))
+        with open(staged_path, "wb") as f:
+            while chunk := await upload.read(CHUNK_SIZE):
+                f.write(chunk)
+        return unique_filename
+
+    def link(self, source_path, filename):
+        # Adopts a finished resumable upload. A hard link, so nothing is
+        # copied and the upload survives if this submission fails.
+        unique_filename = f"{uuid.uuid4().hex}_{os.path.basename(filename)}"
+        staged_path = os.path.join(STAGING_DIR, unique_filename)
+        os.link(source_path, staged_path)
+        # The link shares the upload's inode and so its mtime, which dates
+        # from the last PATCH; restart the reaper's grace period from now
+        os.utime(staged_path)
+        self.files.append((staged_path, unique_filename))
+        return unique_filename
+
+    async def compress(self):
+        # Swaps eligible staged files for their .zst form before promotion
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(_compress_pool, compress_file, staged_path) for staged_path, _ in self.files
+        ))
+        files = []
+        for (staged_path, name), (stored_path, raw_size, stored_size) in zip(self.files, results):
+            files.append((stored_path, name))
+            compression_stats["files_compressed" if stored_path != staged_path else "files_stored_raw"] += 1
+            compression_stats["bytes_in"] += raw_size
+            compression_stats["bytes_stored"] += stored_size
+        self.files = files
+
+    def promote(self):
+        for staged_path, name in self.files:
+            # The staged name carries the .zst suffix when compressed
+            final_path = os.path.join(UPLOAD_DIR, os.path.basename(staged_path))
+            os.replace(staged_path, final_path)
+            self.promoted.append(final_path)
+
+    def discard(self):
+        for path in [staged for staged, _ in self.files] + self.promoted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+# ----- Compressed Storage -----
+
+# Leading bytes of formats that are compressed already: PNG, JPEG, GIF,
+# ZIP (and docx/xlsx/odt), gzip, zstd, bzip2, xz, 7z, RAR, Matroska/WebM,
+# Ogg, FLAC and MP3
+COMPRESSED_MAGIC = (
+    b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"PK\x03\x04", b"\x1f\x8b", b"\x28\xb5\x2f\xfd", b"BZh",
+    b"\xfd7zXZ\x00", b"7z\xbc\xaf\x27\x1c", b"Rar!", b"\x1aE\xdf\xa3", b"OggS", b"fLaC", b"ID3",
+)
+
+def already_compressed(head):
+    if head.startswith(COMPRESSED_MAGIC):
+        return True
+    # WebP, and the ISO media family (MP4, MOV, HEIC, AVIF)
+    return (head[:4] == b"RIFF" and head[8:12] == b"WEBP") or head[4:8] == b"ftyp"
+
+def compress_file(path):
+    # Runs on the compression pool (zstandard releases the GIL). Returns
+    # (path now holding the data, original size, stored size). PDFs are
+    # not sniffed: whether they compress depends on their streams, which
+    # a trial run on the first COMPRESS_SAMPLE bytes finds out.
+    size = os.path.getsize(path)
+    if size < COMPRESS_MIN_SIZE:
+        return path, size, size
+    with open(path, "rb") as f:
+        sample = f.read(COMPRESS_SAMPLE)
+    if already_compressed(sample):
+        return path, size, size
+    if len(zstandard.ZstdCompressor(level=1).compress(sample)) > len(sample) * COMPRESS_MAX_RATIO:
+        return path, size, size
+
+    target = path + COMPRESSED_SUFFIX
+    with open(path, "rb") as source, open(target, "wb") as destination:
+        # size= records the original length in the frame header
+        zstandard.ZstdCompressor(level=COMPRESS_LEVEL).copy_stream(source, destination, size=size)
+    stored = os.path.getsize(target)
+    if stored > size * COMPRESS_MAX_RATIO:
+        os.remove(target)
+        return path, size, size
+    os.remove(path)
+    return target, size, stored
+
+def stored_path(filename):
+    # (path on disk, compressed) for an uploaded file, or None
+    path = os.path.join(UPLOAD_DIR, filename)
+    if os.path.isfile(path):
+        return path, False
+    if os.path.isfile(path + COMPRESSED_SUFFIX):
+        return path + COMPRESSED_SUFFIX, True
+    return None
+
+def logical_name(stored_name):
+    # The filename an application refers to for a file in UPLOAD_DIR
+    return stored_name[:-len(COMPRESSED_SUFFIX)] if stored_name.endswith(COMPRESSED_SUFFIX) else stored_name
+
+def accepts_zstd(accept_encoding):
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() != "zstd":
+            continue
+        params = params.replace(" ", "")
+        try:
+            return not params.startswith("q=") or float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+def decompressed_size(path):
+    # None when the frame header does not record it
+    with open(path, "rb") as f:
+        # A zstd frame header is at most 18 bytes
+        size = zstandard.frame_content_size(f.read(18))
+    return size if size >= 0 else None
+
+def decompressed_chunks(path):
+    # A plain generator, so StreamingResponse runs it on its threadpool
+    with open(path, "rb") as f:
+        yield from zstandard.ZstdDecompressor().read_to_iter(f, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+
+def open_upload(path):
+    # Binary file object with the original bytes, for readers that need
+    # to seek (Pillow, PyMuPDF); compressed files are expanded in memory
+    if not path.endswith(COMPRESSED_SUFFIX):
+        return open(path, "rb")
+    with open(path, "rb") as f:
+        return io.BytesIO(zstandard.ZstdDecompressor().stream_reader(f).read())
+
+def compression_metrics():
+    stored, original = compression_stats["bytes_stored"], compression_stats["bytes_in"]
+    return {**compression_stats, "ratio": round(stored / original, 4) if original else None}
+
+# ----- Orphan Reaper -----
+
+async def referenced_files():
+    referenced = set()
+    for model in (PermitApplication, ArchivedPermitApplication):
+        query = select(model.supporting_files).where(model.supporting_files.isnot(None))
+        async for row in database.iterate(query):
+            try:
+                referenced.update(json.loads(row["supporting_files"]))
+            except json.JSONDecodeError:
+                continue
+    return referenced
+
+def remove_file(path):
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    reaper_stats["files_reaped"] += 1
+    reaper_stats["bytes_reclaimed"] += size
+    return size
+
+async def sweep_directory(path, keep, cutoff, on_remove=None):
+    reclaimed = 0
+    batch = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name not in keep and entry.stat().st_mtime < cutoff:
+                reclaimed += remove_file(entry.path)
+                if on_remove:
+                    on_remove(entry.name)
+            batch += 1
+            if batch >= REAPER_BATCH:
+                # Yield to request handlers between batches
+                batch = 0
+                await asyncio.sleep(0.05)
+    return reclaimed
+
+async def sweep():
+    import previews
+    import uploads
+
+    started = time.monotonic()
+    cutoff = time.time() - REAPER_GRACE
+    referenced = await referenced_files()
+
+    def remove_preview(name):
+        remove_file(os.path.join(previews.PREVIEW_DIR, previews.preview_name(logical_name(name))))
+
+    # Compressed files are on disk under the referenced name plus .zst
+    keep = referenced | {name + COMPRESSED_SUFFIX for name in referenced}
+    reclaimed = await sweep_directory(UPLOAD_DIR, keep, cutoff, on_remove=remove_preview)
+    # Anything still staged after the grace period belongs to a request that died
+    reclaimed += await sweep_directory(STAGING_DIR, set(), cutoff)
+    # Resumable uploads nobody has touched for UPLOAD_EXPIRE_AFTER
+    reclaimed += uploads.expire()
+
+    reaper_stats["last_sweep_at"] = time.time()
+    reaper_stats["last_sweep_seconds"] = round(time.monotonic() - started, 3)
+    return reclaimed
+
+async def _reaper():
+    while True:
+        try:
+            await sweep()
+        except Exception:
+            logger.exception("Upload reaper sweep failed")
+        await asyncio.sleep(REAPER_INTERVAL)
+
+async def start():
+    global _reaper_task, _compress_pool
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    _compress_pool = ThreadPoolExecutor(max_workers=COMPRESS_WORKERS, thread_name_prefix="compress")
+    _reaper_task = asyncio.create_task(_reaper())
+
+async def stop():
+    global _reaper_task, _compress_pool
+    if _reaper_task is not None:
+        _reaper_task.cancel()
+        await asyncio.gather(_reaper_task, return_exceptions=True)
+    if _compress_pool is not None:
+        _compress_pool.shutdown(wait=True)
+    _reaper_task, _compress_pool = None, None
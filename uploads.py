@@ -0,0 +1,293 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import storage
+
+# Resumable uploads for large supporting files, following the tus 1.0 core
+# protocol with the creation, expiration and checksum extensions
+# (https://tus.io/protocols/resumable-upload). The client creates an upload
+# with its total length, PATCHes chunks at the current offset and, after a
+# dropped connection, asks for the offset with HEAD and carries on from
+# there. Finished uploads are referenced by id from the permit form.
+#
+# Each upload is <id>.part (the bytes received so far; its size is the
+# offset) and <id>.json (length and filename) in PARTIAL_DIR. A <id>.lock
+# file marks a PATCH in progress, so two workers never append at once.
+# Once the last byte arrives, the .json also records the file's sha256,
+# which submissions use to recognise the same file sent again under a new
+# id. After a submission uses an upload only the .json is kept, until it
+# expires, so a repeated post of the same form still matches.
+
+TUS_VERSION = "1.0.0"
+# Must be on the same filesystem as STAGING_DIR so finished uploads can be
+# hard-linked into a submission without copying
+PARTIAL_DIR = os.getenv("PARTIAL_UPLOAD_DIR", "upload_partials")
+MAX_SIZE = int(os.getenv("UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+# Counted from the last chunk received
+EXPIRE_AFTER = float(os.getenv("UPLOAD_EXPIRE_AFTER", str(24 * 3600)))
+LOCK_STALE_AFTER = 600
+MAX_FILES = 20
+# Unfinished and unclaimed uploads hold their declared length until they are
+# used in a submission or expire, so creation is refused once that would
+# pass these. Checked against what is on disk, so every worker sees the same
+# totals; two creations racing each other can overshoot by one upload.
+CLIENT_MAX_BYTES = int(os.getenv("UPLOAD_CLIENT_MAX_BYTES", str(2 * MAX_SIZE)))
+CLIENT_MAX_UPLOADS = int(os.getenv("UPLOAD_CLIENT_MAX_UPLOADS", str(2 * MAX_FILES)))
+TOTAL_MAX_BYTES = int(os.getenv("UPLOAD_TOTAL_MAX_BYTES", str(8 * 1024 * 1024 * 1024)))
+
+class UploadError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def paths(upload_id):
+    # Ids are uuid4 hex; anything else never reaches the filesystem
+    try:
+        upload_id = uuid.UUID(hex=upload_id).hex
+    except (TypeError, ValueError):
+        raise UploadError(404, "Unknown upload")
+    base = os.path.join(PARTIAL_DIR, upload_id)
+    return base + ".part", base + ".json", base + ".lock"
+
+def parse_metadata(header):
+    # "key base64value,key2 base64value2"
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in (header or "").split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode("utf-8") if value else ""
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(400, "Invalid Upload-Metadata")
+    return metadata
+
+def read_info(upload_id):
+    _, info_path, _ = paths(upload_id)
+    try:
+        with open(info_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        raise UploadError(404, "Unknown upload")
+
+def write_info(upload_id, info):
+    _, info_path, _ = paths(upload_id)
+    tmp_path = f"{info_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(info, f)
+    os.replace(tmp_path, info_path)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def outstanding(client):
+    # (bytes declared by all uploads, bytes and uploads by this client)
+    total = client_bytes = client_uploads = 0
+    with os.scandir(PARTIAL_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path) as f:
+                    info = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            if info.get("consumed"):
+                continue
+            total += info["length"]
+            if info.get("client") == client:
+                client_bytes += info["length"]
+                client_uploads += 1
+    return total, client_bytes, client_uploads
+
+def create(length, metadata_header, client=None):
+    if length < 0:
+        raise UploadError(400, "Invalid Upload-Length")
+    if length > MAX_SIZE:
+        raise UploadError(413, "Upload too large")
+    metadata = parse_metadata(metadata_header)
+    filename = os.path.basename(metadata.get("filename", "")) or "upload"
+
+    total, client_bytes, client_uploads = outstanding(client)
+    if client_bytes + length > CLIENT_MAX_BYTES or client_uploads >= CLIENT_MAX_UPLOADS:
+        raise UploadError(429, "Too many unfinished uploads; submit or let earlier ones expire first")
+    if total + length > TOTAL_MAX_BYTES:
+        raise UploadError(507, "Upload storage is full; try again later")
+
+    upload_id = uuid.uuid4().hex
+    part_path, info_path, _ = paths(upload_id)
+    open(part_path, "wb").close()
+    with open(info_path, "w") as f:
+        json.dump({"length": length, "filename": filename, "client": client, "created_at": time.time()}, f)
+    return upload_id
+
+def status(upload_id):
+    # (offset, length, expires at, filename); 404 or 410 once it is gone
+    part_path, info_path, _ = paths(upload_id)
+    try:
+        with open(info_path) as f:
+            info = json.load(f)
+        stat = os.stat(part_path)
+    except (FileNotFoundError, json.JSONDecodeError):
+        raise UploadError(404, "Unknown upload")
+    expires_at = stat.st_mtime + EXPIRE_AFTER
+    if expires_at < time.time():
+        raise UploadError(410, "Upload expired")
+    return stat.st_size, info["length"], expires_at, info["filename"]
+
+def parse_checksum(header):
+    # Upload-Checksum: "sha256 <base64 digest>" for the chunk in this request
+    if not header:
+        return None
+    algorithm, _, value = header.partition(" ")
+    if algorithm != "sha256":
+        raise UploadError(400, "Unsupported checksum algorithm")
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error:
+        raise UploadError(400, "Invalid Upload-Checksum")
+
+def acquire_lock(lock_path):
+    for _ in range(2):
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) < LOCK_STALE_AFTER:
+                    break
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+    raise UploadError(423, "Another request is writing to this upload")
+
+async def append(upload_id, offset, chunks, checksum_header=None):
+    # Writes the request body at offset and returns the new offset
+    expected = parse_checksum(checksum_header)
+    part_path, _, lock_path = paths(upload_id)
+    acquire_lock(lock_path)
+    try:
+        current, length, _, _ = status(upload_id)
+        if offset != current:
+            raise UploadError(409, f"Upload-Offset does not match the current offset {current}")
+        digest = hashlib.sha256() if expected is not None else None
+        written = current
+        with open(part_path, "r+b") as f:
+            f.seek(current)
+            try:
+                async for chunk in chunks:
+                    if written + len(chunk) > length:
+                        raise UploadError(413, "Chunk goes past Upload-Length")
+                    f.write(chunk)
+                    written += len(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                if digest is not None and digest.digest() != expected:
+                    raise UploadError(460, "Checksum mismatch")
+            except BaseException as exc:
+                # A dropped connection keeps what arrived, unless the chunk
+                # was to be verified as a whole
+                if isinstance(exc, UploadError) or digest is not None:
+                    f.truncate(current)
+                raise
+        if written == length:
+            info = read_info(upload_id)
+            info["sha256"] = await asyncio.to_thread(file_sha256, part_path)
+            write_info(upload_id, info)
+        return written
+    finally:
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+def terminate(upload_id):
+    for path in paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# ----- Use in Submissions -----
+
+async def digests(upload_ids):
+    # [(filename, sha256)] for finished uploads, including ones a submission
+    # has already used, in the order given
+    if len(upload_ids) > MAX_FILES:
+        raise UploadError(400, "Too many uploads")
+    found = []
+    for upload_id in upload_ids:
+        info = read_info(upload_id)
+        if "sha256" not in info:
+            # Finished by creation alone (zero length), or before digests
+            # were recorded
+            offset, length, _, _ = status(upload_id)
+            if offset != length:
+                raise UploadError(400, f"Upload {upload_id} is not finished")
+            info["sha256"] = await asyncio.to_thread(file_sha256, paths(upload_id)[0])
+            write_info(upload_id, info)
+        found.append((info["filename"], info["sha256"]))
+    return found
+
+def consume(upload_id):
+    # The submission holds its own link to the bytes; keep the record
+    part_path, _, lock_path = paths(upload_id)
+    try:
+        info = read_info(upload_id)
+    except UploadError:
+        return
+    for path in (part_path, lock_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    info["consumed"] = True
+    write_info(upload_id, info)
+
+def completed(upload_ids):
+    # [(part path, filename)] for finished uploads, in the order given
+    if len(upload_ids) > MAX_FILES:
+        raise UploadError(400, "Too many uploads")
+    finished = []
+    for upload_id in upload_ids:
+        offset, length, _, filename = status(upload_id)
+        if offset != length:
+            raise UploadError(400, f"Upload {upload_id} is not finished")
+        finished.append((paths(upload_id)[0], filename))
+    return finished
+
+def expire():
+    # Called by the upload reaper; returns bytes reclaimed
+    if not os.path.isdir(PARTIAL_DIR):
+        return 0
+    cutoff = time.time() - EXPIRE_AFTER
+    reclaimed = 0
+    with os.scandir(PARTIAL_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            upload_id = entry.name[:-len(".json")]
+            try:
+                part_path, _, _ = paths(upload_id)
+            except UploadError:
+                continue
+            try:
+                last_activity = os.path.getmtime(part_path)
+            except FileNotFoundError:
+                last_activity = entry.stat().st_mtime
+            if last_activity < cutoff:
+                reclaimed += storage.remove_file(part_path)
+                terminate(upload_id)
+    return reclaimed
+
+async def start():
+    os.makedirs(PARTIAL_DIR, exist_ok=True)